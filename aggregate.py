@@ -0,0 +1,380 @@
+"""
+Corpus-level aggregation of document reports, per course and per department.
+
+Every document is reduced to a mergeable `Summary`: plain counts and counters that are added
+together to get the summary of a course, of a department or of the whole corpus. A
+`CorpusAggregator` keeps the summary of every document and the running rollups, so adding or
+re-analyzing one document updates its course and department in O(1) without touching the others,
+and queries only read the rollups.
+
+Usage:
+    python aggregate.py aggregates.json [--by course | --by department] [--sort bold_ratio] [--limit 20]
+
+The aggregates file is written by `python batch.py <directory> --aggregate aggregates.json`.
+
+An aggregates file belongs to one corpus root, the directory holding the course directories (e.g.
+`test files`), and every document it summarizes is below that root. Keys are paths relative to the
+root, so a file analyzed from two different working directories is still one document, and loading
+the file for another root is refused instead of silently regrouping every document.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+
+# Prefix of the language of a code block whose language was detected rather than stated, see SectionMetrics
+BEST_GUESS_PREFIX = "Not explicitly stated. Best guess: "
+
+
+def language_name(code_language):
+    """Returns the lowercase language of a code block from its report entry, 'unknown' if it was not detected."""
+    if code_language.startswith(BEST_GUESS_PREFIX):
+        return code_language[len(BEST_GUESS_PREFIX):].lower()
+    if code_language.startswith("Not explicitly stated"):
+        return 'unknown'
+    return code_language.lower()
+
+
+class Summary:
+    """
+    Mergeable summary of one or more documents.
+
+    Summaries only hold sums, so merging is addition and replacing a document is subtracting its old
+    summary and adding the new one. Ratios are derived from the sums when they are asked for.
+    """
+    # Plain counts, added field by field when merging
+    COUNTS = ('documents', 'sections', 'headers', 'words', 'bold', 'italics', 'sentences', 'paragraphs',
+              'inline_code', 'block_quotes', 'internal_links', 'external_links', 'lists', 'code_blocks')
+    # Counters, added key by key when merging
+    COUNTERS = ('code_languages', 'section_alerts', 'document_alerts')
+    # Values derived from the counts, usable in queries like the counts
+    RATIOS = ('bold_ratio', 'italic_ratio', 'links_per_1000_words', 'words_per_document')
+
+    __slots__ = COUNTS + COUNTERS + ('heading_level_count',)
+
+    def __init__(self):
+        """Initializes an empty summary."""
+        for name in self.COUNTS:
+            setattr(self, name, 0)
+        for name in self.COUNTERS:
+            setattr(self, name, Counter())
+        self.heading_level_count = [0]*7
+
+    @classmethod
+    def from_report(cls, report):
+        """
+        Summarizes one document.
+
+        Args:
+            report (DocumentReport): The structured report of the document.
+
+        Returns:
+            Summary: The summary of the document.
+        """
+        summary = cls()
+        summary.documents = 1
+        summary.sections = len(report.sections)
+        summary.headers = report.headers
+        summary.words = report.words
+        summary.bold = report.bold
+        summary.italics = report.italics
+        summary.heading_level_count = list(report.heading_level_count)
+        summary.document_alerts.update(report.alerts)
+        for section in report.sections:
+            summary.sentences += section.sentences
+            summary.paragraphs += section.paragraphs
+            summary.inline_code += section.inline_code
+            summary.block_quotes += section.block_quotes
+            summary.internal_links += len(section.internal_links)
+            summary.external_links += len(section.external_links)
+            summary.lists += len(section.list_lengths)
+            summary.code_blocks += section.code_blocks
+            summary.code_languages.update(language_name(language) for language in section.code_languages)
+            summary.section_alerts.update(section.alerts)
+        return summary
+
+    def add(self, other):
+        """Merges another summary into this one."""
+        for name in self.COUNTS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in self.COUNTERS:
+            getattr(self, name).update(getattr(other, name))
+        self.heading_level_count = [a + b for a, b in zip(self.heading_level_count, other.heading_level_count)]
+
+    def subtract(self, other):
+        """Removes a summary previously merged into this one, e.g. the old version of a document."""
+        for name in self.COUNTS:
+            setattr(self, name, getattr(self, name) - getattr(other, name))
+        for name in self.COUNTERS:
+            counter = getattr(self, name)
+            counter.subtract(getattr(other, name))
+            setattr(self, name, +counter)  # Drops the keys that went down to zero
+        self.heading_level_count = [a - b for a, b in zip(self.heading_level_count, other.heading_level_count)]
+
+    def value(self, name):
+        """Returns a count or a ratio by name."""
+        if name == 'bold_ratio':
+            return self.bold / self.words if self.words else 0.0
+        if name == 'italic_ratio':
+            return self.italics / self.words if self.words else 0.0
+        if name == 'links_per_1000_words':
+            return (self.internal_links + self.external_links) * 1000 / self.words if self.words else 0.0
+        if name == 'words_per_document':
+            return self.words / self.documents if self.documents else 0.0
+        if name in self.COUNTS:
+            return getattr(self, name)
+        raise ValueError(f"Unknown metric {name}")
+
+    def to_dict(self):
+        """Returns the summary as a JSON-serializable dict."""
+        values = {name: getattr(self, name) for name in self.COUNTS}
+        values.update((name, dict(getattr(self, name))) for name in self.COUNTERS)
+        values['heading_level_count'] = self.heading_level_count
+        return values
+
+    @classmethod
+    def from_dict(cls, values):
+        """Rebuilds a summary from the dict returned by `to_dict`."""
+        summary = cls()
+        for name in cls.COUNTS:
+            setattr(summary, name, values[name])
+        for name in cls.COUNTERS:
+            setattr(summary, name, Counter(values[name]))
+        summary.heading_level_count = list(values['heading_level_count'])
+        return summary
+
+
+def default_group(relative_path):
+    """
+    Returns the (department, course) of a document from its path relative to the corpus root.
+
+    The course is the first directory of the path, e.g. 'cs263-Public', and the department is the
+    leading letters of the course name, e.g. 'cs'. Files directly in the root belong to no course.
+    """
+    parts = relative_path.replace('\\', '/').split('/')
+    if len(parts) == 1:
+        return '(none)', '(none)'
+    course = parts[0]
+    match = re.match(r'[A-Za-z]+', course)
+    return (match.group().lower() if match else course), course
+
+
+def default_root(directory):
+    """
+    Returns the corpus root of an analyzed directory: its parent, so the analyzed directory is one
+    course, e.g. 'test files' for 'test files/cs263-Public'. When analyzing a whole corpus, such as
+    'test files', pass that directory as the corpus root instead.
+    """
+    return os.path.dirname(os.path.abspath(directory))
+
+
+class CorpusAggregator:
+    """
+    Per-document summaries of a corpus, with running rollups per course, per department and in total.
+
+    Attributes:
+        root (str): The absolute path of the corpus directory, document paths are stored relative to it.
+    """
+
+    def __init__(self, root='.', group=default_group):
+        """
+        Initializes an empty aggregator.
+
+        Args:
+            root (str): The corpus directory, the directory holding the course directories.
+            group (callable): Returns the (department, course) of a path relative to root.
+        """
+        self.root = os.path.abspath(root)
+        self.group = group
+        self._documents = {} # relative path -> (department, course, Summary)
+        self._courses = {} # course -> Summary
+        self._departments = {} # department -> Summary
+        self._courses_of = {} # department -> set of its courses
+        self._total = Summary()
+
+    def covers(self, path):
+        """Returns whether a path is below the corpus root, only such documents can be added."""
+        return os.path.commonpath([self.root, os.path.abspath(path)]) == self.root
+
+    def _key(self, path):
+        if not self.covers(path):
+            raise ValueError(f"{path} is not below the corpus root {self.root}")
+        return os.path.relpath(os.path.abspath(path), self.root).replace('\\', '/')
+
+    def add(self, path, report):
+        """
+        Adds a document, or replaces its previous version, and updates the rollups.
+
+        Args:
+            path (str): Path of the document.
+            report (DocumentReport): The structured report of the document.
+        """
+        self.add_summary(path, Summary.from_report(report))
+
+    def add_summary(self, path, summary):
+        """Adds the summary of a document, or replaces its previous version, and updates the rollups."""
+        key = self._key(path)
+        self.remove(path)
+        department, course = self.group(key)
+        self._documents[key] = (department, course, summary)
+        self._courses.setdefault(course, Summary()).add(summary)
+        self._departments.setdefault(department, Summary()).add(summary)
+        self._courses_of.setdefault(department, set()).add(course)
+        self._total.add(summary)
+
+    def remove(self, path):
+        """Removes a document from the rollups, does nothing if it was never added."""
+        entry = self._documents.pop(self._key(path), None)
+        if entry is None:
+            return
+        department, course, summary = entry
+        for rollups, name in ((self._courses, course), (self._departments, department)):
+            rollups[name].subtract(summary)
+            if rollups[name].documents == 0:
+                del rollups[name]
+        if course not in self._courses:
+            self._courses_of[department].discard(course)
+            if not self._courses_of[department]:
+                del self._courses_of[department]
+        self._total.subtract(summary)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def total(self):
+        """Returns the summary of the whole corpus."""
+        return self._total
+
+    def course(self, name):
+        """Returns the summary of a course, or None if it has no documents."""
+        return self._courses.get(name)
+
+    def department(self, name):
+        """Returns the summary of a department, or None if it has no documents."""
+        return self._departments.get(name)
+
+    def document(self, path):
+        """Returns the summary of a document, or None if it was never added."""
+        entry = self._documents.get(self._key(path))
+        return entry[2] if entry else None
+
+    def courses(self, department=None):
+        """Returns the names of the courses, of one department only if given."""
+        if department is not None:
+            return sorted(self._courses_of.get(department, ()))
+        return sorted(self._courses)
+
+    def departments(self):
+        """Returns the names of the departments."""
+        return sorted(self._departments)
+
+    def query(self, by='course', sort='words', descending=True, limit=None, where=None, department=None):
+        """
+        Ranks the courses, departments or documents by a metric.
+
+        Args:
+            by (str): 'course', 'department' or 'document'.
+            sort (str): A count or ratio of Summary, e.g. 'words' or 'bold_ratio'.
+            descending (bool): Largest values first.
+            limit (int): Maximum number of results.
+            where (callable): Keeps only the summaries for which where(summary) is true.
+            department (str): Keeps only the courses or documents of one department.
+
+        Returns:
+            list: (name, Summary) pairs in ranking order.
+        """
+        if by == 'course':
+            names = self._courses_of.get(department, ()) if department is not None else self._courses
+            rows = [(name, self._courses[name]) for name in names]
+        elif by == 'department':
+            rows = list(self._departments.items())
+        elif by == 'document':
+            rows = [(key, summary) for key, (dept, _, summary) in self._documents.items()
+                    if department is None or dept == department]
+        else:
+            raise ValueError(f"Cannot aggregate by {by}")
+        if where is not None:
+            rows = [row for row in rows if where(row[1])]
+        rows.sort(key=lambda row: row[1].value(sort), reverse=descending)
+        return rows[:limit] if limit is not None else rows
+
+    def to_dict(self):
+        """Returns the document summaries as a JSON-serializable dict, the rollups are rebuilt on load."""
+        return {'root': self.root,
+                'documents': {key: summary.to_dict() for key, (_, _, summary) in self._documents.items()}}
+
+    def save(self, path):
+        """Writes the aggregates to a JSON file, atomically."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, root=None, group=default_group):
+        """
+        Reads aggregates written by `save`, or returns an empty aggregator if the file does not exist.
+
+        Args:
+            path (str): The aggregates file.
+            root (str): The corpus directory, defaults to the one the aggregates were saved with.
+            group (callable): Returns the (department, course) of a path relative to root.
+
+        Raises:
+            ValueError: If the aggregates were saved for another corpus root.
+        """
+        if not os.path.exists(path):
+            return cls(root or '.', group)
+        with open(path, 'r', encoding='utf-8') as f:
+            values = json.load(f)
+        if root is not None and os.path.realpath(root) != os.path.realpath(values['root']):
+            raise ValueError(f"{path} holds the aggregates of {values['root']}, not of {root}: "
+                             f"use another file, or {values['root']} as the corpus root")
+        aggregator = cls(values['root'], group)
+        for key, summary in values['documents'].items():
+            aggregator.add_summary(os.path.join(aggregator.root, key), Summary.from_dict(summary))
+        return aggregator
+
+
+def format_rows(rows):
+    """Renders query results as a text table."""
+    lines = [f"{'name':32} {'docs':>6} {'words':>9} {'bold %':>7} {'ital %':>7} {'links':>7} {'code':>6} {'alerts':>7}  languages"]
+    for name, summary in rows:
+        languages = ', '.join(f"{language} {count}" for language, count in summary.code_languages.most_common(3))
+        lines.append(f"{name[:32]:32} {summary.documents:6d} {summary.words:9d} "
+                     f"{summary.value('bold_ratio') * 100:7.2f} {summary.value('italic_ratio') * 100:7.2f} "
+                     f"{summary.internal_links + summary.external_links:7d} {summary.code_blocks:6d} "
+                     f"{sum(summary.section_alerts.values()) + sum(summary.document_alerts.values()):7d}  {languages}")
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the corpus aggregates written by batch.py --aggregate.")
+    parser.add_argument('aggregates', help="aggregates file")
+    parser.add_argument('--by', choices=('course', 'department', 'document'), default='course')
+    parser.add_argument('--department', help="only the courses or documents of this department")
+    parser.add_argument('--sort', default='words', help="count or ratio to rank by, e.g. bold_ratio")
+    parser.add_argument('--ascending', action='store_true')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.aggregates):
+        parser.error(f"{args.aggregates} does not exist")
+    aggregator = CorpusAggregator.load(args.aggregates)
+    try:
+        rows = aggregator.query(args.by, args.sort, not args.ascending, args.limit, department=args.department)
+    except ValueError as error:
+        parser.error(str(error))
+    print(format_rows(rows), end='')
+    total = aggregator.total()
+    print(f"\n{total.documents} documents, {total.words} words, bold {total.value('bold_ratio') * 100:.2f}%, "
+          f"italics {total.value('italic_ratio') * 100:.2f}%, {total.code_blocks} code blocks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
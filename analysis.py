@@ -0,0 +1,474 @@
+import io
+import os
+import shutil
+import tempfile
+from collections import Counter
+from cache import AnalysisCache
+from conversion import converter_version, filetype_convert, iter_converted_lines, needs_pandoc
+from instrumentation import instrument
+from markdown_frontend import iter_blocks
+from report import DocumentReport, SectionResult
+from section import MarkdownSection, SectionMetrics, SubtreeMetrics
+
+# Version of the analysis code, bump it whenever sections, metrics or reports change
+ANALYZER_VERSION = "5"
+
+
+def read_markdown(filepath, cache=None, content=None, digest=None):
+    """
+    Reads a file as a list of Markdown lines, converting it with pandoc when it is not Markdown.
+
+    Args:
+        filepath (str): Path of the file to read.
+        cache (AnalysisCache): Cache of converted Markdown, checked before running pandoc.
+        content (bytes): The content of the file if the caller already read it.
+        digest (str): The AnalysisCache digest of content if the caller already computed it.
+
+    Returns:
+        list: The Markdown lines, or None if the conversion failed.
+
+    Raises:
+        ValueError: If the file type is not supported.
+    """
+    #If the file is NOT markdown
+    if not filepath.endswith('.md'):
+        if cache is None:
+            converted_markdown = filetype_convert(filepath)
+        else:
+            if content is None:
+                with open(filepath, 'rb') as file:
+                    content = file.read()
+            if digest is None:
+                digest = cache.digest(content)
+            converted_markdown = cache.get('markdown', converter_version(), digest, len(content))
+            if converted_markdown is None:
+                converted_markdown = filetype_convert(filepath)
+                if converted_markdown is not None:
+                    cache.put('markdown', converter_version(), digest, converted_markdown)
+        if converted_markdown is None:
+            return None
+        return converted_markdown.splitlines(keepends=True)
+
+    with open(filepath, 'r', encoding='utf-8') as file:
+        return file.readlines()
+
+
+def iter_sections(markdown_input, heading_level_count=None):
+    """
+    Every time a header is detected in the Markdown lines, yield the Section instance
+    (section.py class) of the content that header closes.
+
+    Headings are found by the Markdown frontend, so lines in fenced code blocks are never headings
+    and setext headings are. The lines are consumed lazily and the content of the open section is
+    buffered in a list that is joined once, so memory is bounded by the largest section rather than
+    by the document.
+
+    Args:
+        markdown_input (iterable): The Markdown lines of the document, e.g. an open file.
+        heading_level_count (list): Filled with the number of headers at each level 1-7 as they are read.
+
+    Yields:
+        MarkdownSection: Each section of the document, in order.
+    """
+    if heading_level_count is None:
+        heading_level_count = [0]*7
+    current_heading = None
+    current_content = []
+    heading_level = 0  
+
+    for level, line in iter_blocks(markdown_input):
+        if level:
+            if current_heading is not None:
+                yield MarkdownSection(current_heading, heading_level, "".join(current_content))
+                current_content = []  # Reset the content for the next section.
+            heading_level = level
+            heading_level_count[heading_level-1] += 1
+            current_heading = line
+        else:
+            current_content.append(line if line.strip() != '' else '\n\n')
+
+    if current_heading is not None:
+        yield MarkdownSection(current_heading, heading_level, "".join(current_content))
+
+
+@instrument('split_sections', size=lambda result, markdown_input: sum(len(section.raw_content) for section in result[0]))
+def split_sections(markdown_input):
+    """
+    Splits Markdown lines into a list of MarkdownSection instances.
+
+    Args:
+        markdown_input (iterable): The Markdown lines of the document.
+
+    Returns:
+        tuple: The list of MarkdownSection instances and the number of headers at each level 1-7.
+    """
+    heading_level_count = [0]*7
+    sections = list(iter_sections(markdown_input, heading_level_count))
+    return sections, heading_level_count
+
+
+def build_section_tree(sections):
+    """
+    Nests sections under the closest previous section of a lower heading level, in one linear pass.
+
+    Each section's SubtreeMetrics are rolled up bottom-up in the same pass: a section's subtree is
+    complete when a heading of the same or a lower level closes it, and is then added to its parent.
+    Afterwards every subtree query is O(1) per section.
+
+    Args:
+        sections (list): The MarkdownSection instances, in document order.
+
+    Returns:
+        list: The top-level sections, each with its `subsections`, `subtree` and `header_total` set.
+    """
+    roots = []
+    stack = [] # Open sections, each nested under the one before it
+
+    def close_last():
+        closed = stack.pop()
+        closed.header_total = closed.subtree.headers
+        if stack:
+            stack[-1].subtree.add(closed.subtree)
+
+    for section in sections:
+        section.subsections = []
+        section.subtree = SubtreeMetrics.of_section(section)
+        while stack and stack[-1].heading_level >= section.heading_level:
+            close_last()
+        if stack:
+            stack[-1].add_subsection(section)
+        else:
+            roots.append(section)
+        stack.append(section)
+    while stack:
+        close_last()
+    return roots
+
+
+# Names of the document totals, in the order of `section_totals`
+TOTAL_NAMES = ('words', 'bold', 'italics', 'headers')
+
+
+def section_totals(section):
+    """Returns what a section contributes to each of the document totals."""
+    return {
+        'words': section.word_count(),
+        'bold': section.bold_count(),
+        'italics': section.italic_count(),
+        'headers': 1, # Every section is one header, whatever its subsections
+    }
+
+
+class DocumentAnalysis:
+    """
+    Analysis of a whole document: its sections and the document totals.
+    """
+
+    def __init__(self, file_name, sections, heading_level_count, totals=None):
+        """
+        Initializes an instance of the DocumentAnalysis class and calculates the document totals.
+
+        Args:
+            file_name (str): Name of the analyzed file, shown at the top of the report.
+            sections (list): The MarkdownSection instances of the document.
+            heading_level_count (list): The number of headers at each level 1-7.
+            totals (dict): Already known document totals, keyed like `section_totals`, instead of summing the sections.
+        """
+        self.file_name = file_name
+        self.sections = sections
+        self.heading_level_count = heading_level_count
+        self.content_hash = None # SHA-256 of the analyzed file, set when the analysis comes from a file
+        self.roots = build_section_tree(sections) # Top-level sections of the heading tree
+
+        # Calculate total count of variables
+        if totals is None:
+            totals = dict.fromkeys(TOTAL_NAMES, 0)
+            for section in sections:
+                for name, value in section_totals(section).items():
+                    totals[name] += value
+        self.word_count_total   = totals['words']
+        self.bold_count_total   = totals['bold']
+        self.italic_count_total = totals['italics']
+        self.header_count_total = totals['headers']
+
+    def totals(self):
+        """Returns the document totals keyed like `section_totals`."""
+        return {
+            'words': self.word_count_total,
+            'bold': self.bold_count_total,
+            'italics': self.italic_count_total,
+            'headers': self.header_count_total,
+        }
+
+    def to_dict(self):
+        """Returns the sections and their metrics as a JSON-serializable dict, e.g. for a cache."""
+        return {
+            'heading_level_count': self.heading_level_count,
+            'sections': [[section.heading, section.heading_level, section.raw_content, section.metrics.to_dict()]
+                         for section in self.sections],
+        }
+
+    @classmethod
+    def from_dict(cls, values, file_name):
+        """Rebuilds an analysis from the dict returned by `to_dict` without recomputing any metric."""
+        sections = [MarkdownSection(heading, heading_level, raw_content, SectionMetrics.from_dict(metrics))
+                    for heading, heading_level, raw_content, metrics in values['sections']]
+        return cls(file_name, sections, values['heading_level_count'])
+
+    def most(self, metric, level=None):
+        """
+        Returns the section whose subtree has the highest value of a metric, e.g. the chapter with
+        the most external links is most('external_links', level=1).
+
+        Args:
+            metric (str): A SubtreeMetrics attribute: 'headers', 'words', 'bold', 'italics',
+                'internal_links', 'external_links', 'code_blocks' or 'alerts'.
+            level (int): Only consider sections of this heading level.
+
+        Returns:
+            MarkdownSection: The section, or None if no section has that level.
+        """
+        candidates = [section for section in self.sections if level is None or section.heading_level == level]
+        return max(candidates, key=lambda section: getattr(section.subtree, metric), default=None)
+
+    def to_report(self):
+        """Returns the structured report of the document."""
+        return DocumentReport(self.file_name, self.totals(), self.heading_level_count,
+                              [SectionResult.from_section(section) for section in self.sections], self.content_hash)
+
+    def report(self):
+        """Generates the text report of the document."""
+        return self.to_report().to_text()
+
+
+class AnalysisCancelled(Exception):
+    """Raised by a progress callback to stop an analysis, e.g. when the user cancels it."""
+
+
+def analyze_markdown(markdown_input, file_name, progress=None):
+    """
+    Analyzes Markdown lines without any GUI or file system access.
+
+    Args:
+        markdown_input (list): The Markdown lines of the document.
+        file_name (str): Name of the analyzed file, shown at the top of the report.
+        progress (callable): Called as progress(section, done, total) once each section is analyzed,
+            it may raise AnalysisCancelled to stop the analysis.
+
+    Returns:
+        DocumentAnalysis: The analysis of the document.
+    """
+    if progress is None:
+        sections, heading_level_count = split_sections(markdown_input)
+        return DocumentAnalysis(file_name, sections, heading_level_count)
+
+    # Every section starts with a heading, so counting them gives the total up front
+    total = sum(1 for level, _ in iter_blocks(markdown_input) if level)
+    sections = []
+    heading_level_count = [0]*7
+    for section in iter_sections(markdown_input, heading_level_count):
+        section.metrics # Compute the metrics now, on the caller's thread
+        sections.append(section)
+        progress(section, len(sections), total)
+    return DocumentAnalysis(file_name, sections, heading_level_count)
+
+
+class IncrementalAnalyzer:
+    """
+    Re-analyzes successive versions of one document, e.g. on every save in a watch mode.
+
+    Every section is fingerprinted by its heading and raw content. On each run only the sections
+    whose fingerprint is new are tokenized, the others reuse the metrics of the previous run, and the
+    document totals are updated from the sections that were added and removed since the last run.
+
+    Attributes:
+        file_name (str): Name of the analyzed file, shown at the top of the report.
+        reused (int): Number of sections whose metrics were reused on the last run.
+        recomputed (int): Number of sections whose metrics were computed on the last run.
+    """
+
+    def __init__(self, file_name):
+        """
+        Initializes an instance of the IncrementalAnalyzer class.
+
+        Args:
+            file_name (str): Name of the analyzed file, shown at the top of the report.
+        """
+        self.file_name = file_name
+        self.reused = 0
+        self.recomputed = 0
+        self._metrics = {} # Fingerprint -> SectionMetrics of the sections of the last run
+        self._contributions = {} # Fingerprint -> section_totals of the sections of the last run
+        self._fingerprints = Counter() # Fingerprints of the last run, with the number of sections having each
+        self._totals = dict.fromkeys(TOTAL_NAMES, 0)
+
+    def analyze(self, markdown_input):
+        """
+        Analyzes the current version of the document.
+
+        Args:
+            markdown_input (list): The Markdown lines of the document.
+
+        Returns:
+            DocumentAnalysis: The analysis of the document.
+        """
+        sections, heading_level_count = split_sections(markdown_input)
+        fingerprints = Counter()
+        self.reused = self.recomputed = 0
+        for section in sections:
+            fingerprint = section.fingerprint()
+            fingerprints[fingerprint] += 1
+            metrics = self._metrics.get(fingerprint)
+            if metrics is None:
+                self._metrics[fingerprint] = section.metrics
+                self._contributions[fingerprint] = section_totals(section)
+                self.recomputed += 1
+            else:
+                section.metrics = metrics
+                self.reused += 1
+
+        # Update the totals from the sections removed and added since the last run
+        for fingerprint, count in (self._fingerprints - fingerprints).items():
+            for name, value in self._contributions[fingerprint].items():
+                self._totals[name] -= value * count
+        for fingerprint, count in (fingerprints - self._fingerprints).items():
+            for name, value in self._contributions[fingerprint].items():
+                self._totals[name] += value * count
+
+        # Forget the sections that are gone so memory stays bounded by the current document
+        for fingerprint in self._fingerprints.keys() - fingerprints.keys():
+            del self._metrics[fingerprint]
+            del self._contributions[fingerprint]
+        self._fingerprints = fingerprints
+
+        return DocumentAnalysis(self.file_name, sections, heading_level_count, dict(self._totals))
+
+
+def analysis_version(filepath):
+    """Returns the version of the cached analysis of a file, a converted file also depends on the converter."""
+    return ANALYZER_VERSION if filepath.endswith('.md') else f"{ANALYZER_VERSION}+{converter_version()}"
+
+
+def needs_conversion(filepath, cache=None, digest=None):
+    """
+    Returns whether analyzing a file will run pandoc, so it can be converted ahead of the analysis.
+
+    Args:
+        filepath (str): Path of the file to analyze.
+        cache (AnalysisCache): Cache of converted Markdown and analyses, nothing is converted for a cached file.
+        digest (str): The AnalysisCache digest of the file content, required with a cache.
+    """
+    if not needs_pandoc(filepath):
+        return False
+    if cache is None:
+        return True
+    return not (cache.has('analysis', analysis_version(filepath), digest)
+                or cache.has('markdown', converter_version(), digest))
+
+
+def analyze_file(filepath, cache=None, progress=None, digest=None, converted=None):
+    """
+    Reads, converts if needed, and analyzes a file.
+
+    Args:
+        filepath (str): Path of the file to analyze.
+        cache (AnalysisCache): Cache of converted Markdown and analyses, keyed by the file content.
+        progress (callable): Called as progress(section, done, total) once each section is analyzed,
+            it may raise AnalysisCancelled to stop the analysis.
+        digest (str): The AnalysisCache digest of the file content if the caller already computed it.
+        converted (str): The Markdown of a file the caller already converted, e.g. on a ConversionPool.
+
+    Returns:
+        DocumentAnalysis: The analysis of the file, or None if the conversion failed.
+
+    Raises:
+        ValueError: If the file type is not supported.
+        AnalysisCancelled: If the progress callback cancelled the analysis.
+    """
+    file_name = os.path.basename(filepath)
+    with open(filepath, 'rb') as file:
+        content = file.read()
+    if digest is None:
+        digest = AnalysisCache.digest(content)
+
+    if cache is not None:
+        version = analysis_version(filepath)
+        cached = cache.get('analysis', version, digest, len(content))
+        if cached is not None:
+            analysis = DocumentAnalysis.from_dict(cached, file_name)
+            analysis.content_hash = digest
+            if progress is not None:
+                for done, section in enumerate(analysis.sections, start=1):
+                    progress(section, done, len(analysis.sections))
+            return analysis
+
+    if filepath.endswith('.md'):
+        markdown_input = io.StringIO(content.decode('utf-8'), newline=None).readlines()
+    elif converted is not None:
+        if cache is not None:
+            # Kept for the next analysis, as read_markdown does with the Markdown it converts
+            cache.put('markdown', converter_version(), digest, converted)
+        markdown_input = converted.splitlines(keepends=True)
+    else:
+        markdown_input = read_markdown(filepath, cache, content, digest)
+        if markdown_input is None:
+            return None
+
+    analysis = analyze_markdown(markdown_input, file_name, progress)
+    analysis.content_hash = digest
+    if cache is not None:
+        cache.put('analysis', version, digest, analysis.to_dict())
+    return analysis
+
+
+def iter_markdown_lines(filepath, timeout=None):
+    """
+    Yields the Markdown lines of a file as they are read, streaming pandoc's output for other types.
+
+    Args:
+        filepath (str): Path of the file to read.
+        timeout (float): Seconds after which pandoc is killed if it has not finished, None to wait forever.
+
+    Raises:
+        ValueError: If the file type is not supported.
+        FileNotFoundError: If the file or pandoc cannot be found.
+        subprocess.SubprocessError: If pandoc failed or was killed after the timeout.
+    """
+    if filepath.endswith('.md'):
+        with open(filepath, 'r', encoding='utf-8') as file:
+            yield from file
+    else:
+        yield from iter_converted_lines(filepath, timeout)
+
+
+@instrument('report.stream')
+def stream_report(markdown_input, file_name, out):
+    """
+    Analyzes a document section by section and writes its report, keeping one section in memory.
+
+    Section reports are spooled to a temporary file until the document totals at the top of the
+    report are known, so memory is bounded by the largest section even for very large inputs.
+
+    Args:
+        markdown_input (iterable): The Markdown lines of the document, e.g. from `iter_markdown_lines`.
+        file_name (str): Name of the analyzed file, shown at the top of the report.
+        out (file): Text file the report is written to.
+
+    Returns:
+        DocumentAnalysis: The document totals and header counts, without the sections.
+    """
+    heading_level_count = [0]*7
+    totals = dict.fromkeys(TOTAL_NAMES, 0)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+', encoding='utf-8') as body:
+        for i, section in enumerate(iter_sections(markdown_input, heading_level_count)):
+            for name, value in section_totals(section).items():
+                totals[name] += value
+            if i:
+                body.write('\n\n')  # Add a newline between sections
+            body.writelines(SectionResult.from_section(section).text_parts())
+
+        analysis = DocumentAnalysis(file_name, [], heading_level_count, totals)
+        out.writelines(analysis.to_report().header_parts())
+        body.seek(0)
+        shutil.copyfileobj(body, out)
+    return analysis
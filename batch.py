@@ -0,0 +1,392 @@
+"""
+Headless batch analysis of whole course directories.
+
+Usage:
+    python batch.py "test files/cs263-Public" [--repository ./repository] [--workers N] [--cache ./cache | --no-cache]
+                    [--export results.jsonl | --export results.csv] [--profile] [--metrics-file stages.prom]
+                    [--aggregate aggregates.json [--corpus-root "test files"]] [--conversion-timeout 60]
+
+Files converted by pandoc are converted on a ConversionPool of this process, which kills a
+conversion after --conversion-timeout seconds, while the worker processes analyze the files that
+are ready.
+
+With --no-cache and neither --export nor --aggregate, nothing needs a file's full analysis: the
+workers then stream every file, pandoc's output included, section by section into its report file,
+so memory is bounded by the largest section rather than the largest file.
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import instrumentation
+from aggregate import CorpusAggregator, default_root
+from analysis import analyze_file, iter_markdown_lines, needs_conversion, stream_report
+from cache import AnalysisCache
+from conversion import CONVERSION_TIMEOUT, ConversionPool, conversion_error, needs_pandoc
+from report import CSV_COLUMNS
+from repository import ReportRepository
+
+# File types the batch run picks up while walking a directory tree
+SUPPORTED_EXTENSIONS = ('.md', '.txt', '.docx', '.html')
+
+
+def find_files(directory):
+    """Returns the sorted paths of every supported file below a directory."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[-1].lower() in SUPPORTED_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+# Cache of the worker process, opened by init_worker
+_cache = None
+# Directory streamed reports are written to and pandoc timeout of the worker process, set by init_worker
+_report_dir = None
+_conversion_timeout = CONVERSION_TIMEOUT
+
+
+def init_worker(cache_dir, profile=False, report_dir=None, conversion_timeout=CONVERSION_TIMEOUT):
+    """Opens the analysis cache once in each worker process, and turns on its instrumentation if asked."""
+    global _cache, _report_dir, _conversion_timeout
+    _cache = AnalysisCache(cache_dir) if cache_dir else None
+    _report_dir = report_dir
+    _conversion_timeout = conversion_timeout
+    if profile:
+        instrumentation.enable()
+
+
+def ping():
+    """Does nothing, submitted to make a pool start its processes."""
+
+
+def new_result(filepath, error=None):
+    """Returns the result of a file before it is analyzed, or of a file that failed with an error."""
+    return {'path': filepath, 'file_name': os.path.basename(filepath), 'report': None, 'report_file': None,
+            'error': error, 'content_hash': None, 'totals': None, 'cache': {}, 'stages': {}}
+
+
+def analyze_path(filepath, digest=None, converted=None):
+    """
+    Analyzes one file in a worker process.
+
+    Args:
+        filepath (str): The file to analyze.
+        digest (str): The content hash of the file if the parent process already computed it.
+        converted (str): The Markdown of the file if the parent process already converted it.
+
+    Returns:
+        dict: The file path and name, the DocumentReport (None on failure), an error message, the
+        content hash and totals of the file, the worker's cache statistics delta and its instrumented stages.
+    """
+    result = new_result(filepath)
+    before = _cache.stats() if _cache else None
+    try:
+        analysis = analyze_file(filepath, _cache, digest=digest, converted=converted)
+    except (ValueError, OSError, UnicodeDecodeError) as error:
+        result['error'] = str(error)
+    else:
+        if analysis is None:
+            result['error'] = "conversion failed"
+        else:
+            result.update(report=analysis.to_report(), content_hash=analysis.content_hash, totals=analysis.totals())
+
+    if _cache:
+        after = _cache.stats()
+        result['cache'] = {key: after[key] - before[key] for key in ('hits', 'misses', 'bytes_saved')}
+    return add_stages(result)
+
+
+def add_stages(result):
+    """Moves the instrumented stages of the worker into the result of its file."""
+    if instrumentation.enabled:
+        # Stages of this file only, the parent process adds up the stages of every worker
+        result['stages'] = instrumentation.summary()
+        instrumentation.reset()
+    return result
+
+
+def analyze_paths(items):
+    """Analyzes a chunk of (path, content hash or None) in a worker process, see `analyze_path`."""
+    return [analyze_path(filepath, digest) for filepath, digest in items]
+
+
+def stream_path(filepath):
+    """
+    Analyzes one file in a worker process, streaming it into a report file of the report directory.
+
+    Pandoc's output is read as it is written, with the worker's conversion timeout, and neither the
+    file nor its analysis is ever held in memory as a whole.
+
+    Returns:
+        dict: Like `analyze_path`, with the path of the report file instead of the DocumentReport.
+    """
+    result = new_result(filepath)
+    descriptor, report_file = tempfile.mkstemp(suffix='.tmp', dir=_report_dir)
+    try:
+        with open(descriptor, 'w', encoding='utf-8') as out:
+            analysis = stream_report(iter_markdown_lines(filepath, _conversion_timeout), result['file_name'], out)
+        content_hash = AnalysisCache.file_digest(filepath)
+    except (ValueError, OSError, UnicodeDecodeError, subprocess.SubprocessError) as error:
+        os.remove(report_file)
+        if isinstance(error, subprocess.SubprocessError) or getattr(error, 'filename', None) == 'pandoc':
+            result['error'] = f"conversion failed: {conversion_error(error)}"
+        else:
+            result['error'] = str(error)
+    else:
+        result.update(report_file=report_file, content_hash=content_hash, totals=analysis.totals())
+    return add_stages(result)
+
+
+def stream_paths(items):
+    """Streams a chunk of (path, None) in a worker process, see `stream_path`."""
+    return [stream_path(filepath) for filepath, _ in items]
+
+
+def start_conversions(paths, pool, cache_dir=None):
+    """
+    Starts converting the files whose analysis needs pandoc on a conversion pool.
+
+    Files whose analysis or converted Markdown is cached are not converted, their content hash is
+    kept so the worker does not compute it again.
+
+    Returns:
+        list: The (content hash or None, Future of the Markdown or None) of every path.
+    """
+    cache = AnalysisCache(cache_dir) if cache_dir else None
+    conversions = []
+    for path in paths:
+        digest = conversion = None
+        if needs_pandoc(path):
+            try:
+                if cache is not None:
+                    with open(path, 'rb') as file:
+                        digest = cache.digest(file.read())
+                if needs_conversion(path, cache, digest):
+                    conversion = pool.submit(path)
+            except OSError:
+                digest = None # The worker reports it
+        conversions.append((digest, conversion))
+    return conversions
+
+
+def analyze_converted(executor, filepath, digest, conversion):
+    """Returns a Future of the result of a file, analyzed on the executor once its conversion finished."""
+    analyzed = Future()
+
+    def copy(future):
+        try:
+            analyzed.set_result(future.result())
+        except Exception as error:
+            analyzed.set_exception(error)
+
+    def converted(conversion):
+        try:
+            markdown = conversion.result()
+        except Exception as error:
+            analyzed.set_result(new_result(filepath, f"conversion failed: {conversion_error(error)}"))
+            return
+        try:
+            executor.submit(analyze_path, filepath, digest, markdown).add_done_callback(copy)
+        except Exception as error: # The executor was shut down or broken
+            analyzed.set_exception(error)
+
+    conversion.add_done_callback(converted)
+    return analyzed
+
+
+def submit_analyses(executor, paths, conversions, chunksize, analyze_chunk=analyze_paths):
+    """
+    Submits the analysis of every file, in chunks for the files that are not converted first.
+
+    Args:
+        analyze_chunk (function): Analyzes a chunk of (path, content hash or None) in a worker process.
+
+    Returns:
+        list: The (Future, index of the result in the Future's chunk or None) of every path, in order.
+    """
+    futures = [None] * len(paths)
+    chunk = [] # Indices of the paths of the next chunk
+
+    def submit_chunk():
+        future = executor.submit(analyze_chunk, [(paths[i], conversions[i][0]) for i in chunk])
+        for position, i in enumerate(chunk):
+            futures[i] = (future, position)
+        chunk.clear()
+
+    for i, (path, (digest, conversion)) in enumerate(zip(paths, conversions)):
+        if conversion is None:
+            chunk.append(i)
+            if len(chunk) == chunksize:
+                submit_chunk()
+        else:
+            futures[i] = (analyze_converted(executor, path, digest, conversion), None)
+    if chunk:
+        submit_chunk()
+    return futures
+
+
+def open_export(path):
+    """
+    Opens a structured export of the reports, JSON Lines or CSV depending on the file extension.
+
+    Returns:
+        tuple: The open file and a function writing one DocumentReport to it.
+    """
+    out = open(path, 'w', encoding='utf-8', newline='')
+    if path.lower().endswith('.csv'):
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+        return out, lambda report: writer.writerows(report.csv_rows())
+    return out, lambda report: out.write(report.to_json() + '\n')
+
+
+def run_batch(directory, repo='./repository', workers=None, cache_dir='./cache', export=None, profile=False,
+              aggregate=None, corpus_root=None, conversion_timeout=CONVERSION_TIMEOUT):
+    """
+    Analyzes every supported file below a directory on a process pool and writes the reports.
+
+    Args:
+        directory (str): The course directory to analyze.
+        repo (str): The repository directory the reports are written to.
+        workers (int): Number of worker processes, defaults to the number of cores.
+        cache_dir (str): Directory of the analysis cache, None to analyze every file from scratch.
+        export (str): Path of a .jsonl or .csv file the structured reports are also written to.
+        profile (bool): Record the wall time, calls and bytes of every analysis stage.
+        aggregate (str): Path of the corpus aggregates file the documents are added to.
+        corpus_root (str): Directory holding the course directories, defaults to the parent of directory.
+        conversion_timeout (float): Seconds after which a pandoc conversion is killed and its file failed.
+
+    Without a cache, an export or aggregates, the reports are streamed into the repository and pandoc
+    runs in the workers rather than on the conversion pool, see the module docstring.
+
+    Returns:
+        dict: Throughput and conversion pool statistics of the run, with the instrumented stages if profile is True.
+    """
+    paths = find_files(directory)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    failed = []
+    cache_stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0}
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (4 * workers))
+
+    if profile:
+        instrumentation.reset()
+        instrumentation.enable()
+
+    export_file, export_report = open_export(export) if export else (None, None)
+    aggregator = CorpusAggregator.load(aggregate, corpus_root or default_root(directory)) if aggregate else None
+    # Nothing but the report text is needed, which the workers can write as they read
+    streaming = not (cache_dir or export or aggregate)
+    start = time.perf_counter()
+    with ConversionPool(workers, conversion_timeout) as pool, ReportRepository(repo) as repository, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(cache_dir, profile, repository.directory, conversion_timeout)) as executor:
+        # The workers are forked before pandoc runs on the pool threads: a process forked while a thread
+        # starts pandoc keeps the pipe subprocess waits on open, and the conversion would hang until it exits
+        executor.submit(ping).result()
+        if streaming:
+            futures = submit_analyses(executor, paths, [(None, None)] * len(paths), chunksize, stream_paths)
+        else:
+            futures = submit_analyses(executor, paths, start_conversions(paths, pool, cache_dir), chunksize)
+        # Reports are saved by this process only, workers never touch the repository index
+        for future, position in futures:
+            result = future.result() if position is None else future.result()[position]
+            for key, value in result['cache'].items():
+                cache_stats[key] += value
+            instrumentation.merge(result['stages'])
+            if result['error'] is not None:
+                failed.append((result['path'], result['error']))
+                continue
+            if result['report_file'] is not None:
+                repository.save_file(result['report_file'], result['file_name'], result['path'],
+                                     result['content_hash'], result['totals'])
+                continue
+            report = result['report']
+            repository.save(report.to_text(), result['file_name'], result['path'],
+                            result['content_hash'], result['totals'])
+            if export_report:
+                export_report(report)
+            if aggregator is not None:
+                aggregator.add(result['path'], report)
+    elapsed = time.perf_counter() - start
+    if export_file:
+        export_file.close()
+    if aggregator is not None:
+        aggregator.save(aggregate)
+
+    return {
+        'files': len(paths),
+        'failed': failed,
+        'bytes': total_bytes,
+        'seconds': elapsed,
+        'files_per_sec': len(paths) / elapsed if elapsed else 0.0,
+        'mb_per_sec': total_bytes / 1e6 / elapsed if elapsed else 0.0,
+        'cache': cache_stats if cache_dir else None,
+        'conversion': pool.stats(),
+        'stages': instrumentation.summary() if profile else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze every supported file of a course directory.")
+    parser.add_argument('directory', help="directory tree to analyze")
+    parser.add_argument('--repository', default='./repository', help="directory the reports are written to")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument('--cache', default='./cache', help="directory of the analysis cache")
+    parser.add_argument('--no-cache', action='store_true', help="analyze every file from scratch")
+    parser.add_argument('--export', help="also write the structured reports to a .jsonl or .csv file")
+    parser.add_argument('--profile', action='store_true', help="print the time, calls and bytes of every analysis stage")
+    parser.add_argument('--aggregate', help="add the documents to the per-course aggregates kept in this file")
+    parser.add_argument('--corpus-root', help="directory holding the course directories, for --aggregate "
+                                              "(default: the parent of the analyzed directory)")
+    parser.add_argument('--metrics-file', help="write the analysis stages in the Prometheus text format to this file")
+    parser.add_argument('--conversion-timeout', type=float, default=CONVERSION_TIMEOUT,
+                        help="seconds after which a pandoc conversion is stopped and its file skipped")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if args.aggregate:
+        # Checked before the run rather than after analyzing everything
+        try:
+            aggregator = CorpusAggregator.load(args.aggregate, args.corpus_root or default_root(args.directory))
+        except ValueError as error:
+            parser.error(str(error))
+        if not aggregator.covers(args.directory):
+            parser.error(f"{args.directory} is not below the corpus root {aggregator.root}")
+
+    stats = run_batch(args.directory, args.repository, args.workers, None if args.no_cache else args.cache, args.export,
+                      args.profile or bool(args.metrics_file), args.aggregate, args.corpus_root,
+                      args.conversion_timeout)
+    for filepath, error in stats['failed']:
+        print(f"Skipped {filepath}: {error}", file=sys.stderr)
+    print(f"Analyzed {stats['files'] - len(stats['failed'])}/{stats['files']} files "
+          f"({stats['bytes'] / 1e6:.2f} MB) in {stats['seconds']:.2f} s: "
+          f"{stats['files_per_sec']:.1f} files/sec, {stats['mb_per_sec']:.2f} MB/sec")
+    if stats['cache'] is not None:
+        print(f"Cache: {stats['cache']['hits']} hits, {stats['cache']['misses']} misses, "
+              f"{stats['cache']['bytes_saved'] / 1e6:.2f} MB not re-analyzed")
+    conversion = stats['conversion']
+    if conversion['completed'] or conversion['failed']:
+        print(f"Conversion: {conversion['completed']} converted, {conversion['failed']} failed on "
+              f"{conversion['max_workers']} pandoc workers, latency p50 {conversion['latency_p50']:.2f} s, "
+              f"p95 {conversion['latency_p95']:.2f} s, max {conversion['latency_max']:.2f} s")
+    if args.profile:
+        print(instrumentation.format_summary(stats['stages']), end='')
+    if args.metrics_file:
+        # Written to a temporary file first so a scraper never reads a half-written file
+        with open(args.metrics_file + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(instrumentation.to_prometheus(stats['stages']))
+        os.replace(args.metrics_file + '.tmp', args.metrics_file)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
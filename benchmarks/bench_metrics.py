@@ -0,0 +1,170 @@
+"""
+Benchmarks building section reports with the cached metrics record against the previous
+implementation, which re-scanned `raw_content` every time a metric was asked for.
+
+Run from the project root:
+    python benchmarks/bench_metrics.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import read_markdown, split_sections
+from determine_language import CodeLanguageIdentifier
+from markdown_frontend import tokenize
+from section import MarkdownSection, SectionMetrics
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test files')
+
+
+class LegacyCodeLanguageIdentifier(CodeLanguageIdentifier):
+    """Frozen copy of the substring search per pattern the compiled matcher replaced, kept for comparison."""
+
+    patterns = CodeLanguageIdentifier().languages_patterns
+
+    def __init__(self):
+        self.languages_patterns = dict(self.patterns)
+
+    def identify_language(self, code_block):
+        scores = {language: 0 for language in self.languages_patterns}
+        for language, patterns in self.languages_patterns.items():
+            for pattern in patterns:
+                if pattern.search(code_block) if isinstance(pattern, re.Pattern) else pattern in code_block:
+                    scores[language] += 1
+        identified_language = max(scores, key=scores.get)
+        return "Unknown" if scores[identified_language] == 0 else identified_language
+
+
+class LegacyMarkdownSection(MarkdownSection):
+    """
+    Frozen copy of the per-call metric methods the cached record replaced, kept for comparison.
+
+    Each call re-tokenizes `raw_content` the way the legacy methods re-ran their regexes, so the
+    reports must match exactly and only the cost of the repeated scans differs.
+    """
+
+    def tokens(self, kind):
+        return tokenize(self.raw_content)[kind]
+
+    def word_count(self):
+        return len(self.raw_content.split())
+
+    def sentence_count(self):
+        return len(self.tokens('sentence')) if self.raw_content.strip() else 0
+
+    def paragraph_count(self):
+        return len([p for p in self.raw_content.split('\n\n') if p.strip()])
+
+    def inline_code_count(self):
+        return len(self.tokens('inline_code'))
+
+    def bold_count(self):
+        return SectionMetrics._bold_words(self.tokens('bold'))
+
+    def italic_count(self):
+        return len(self.tokens('italic'))
+
+    def block_quote_count(self):
+        return len(self.tokens('quote'))
+
+    def list_count(self):
+        lists = SectionMetrics._list_lengths(self.tokens('list_item'), self.raw_content)
+        return len(lists), lists
+
+    def analyze_hyperlinks(self):
+        links = [token.value for token in self.tokens('link')]
+        return ([link for link in links if self.is_internal_link(link)],
+                [link for link in links if not self.is_internal_link(link)])
+
+    def analyze_code_blocks(self):
+        code_identifier = LegacyCodeLanguageIdentifier()
+        code_blocks = [token.value for token in self.tokens('code_block')]
+        code_languages = []
+        for block in code_blocks:
+            first_word = block.split()[0].lower() if block.split() else ""
+            if first_word in ["python", "jd", "java", "cpp", "rust", "kotlin"]:
+                code_languages.append(first_word)
+            elif code_identifier.identify_language(block.strip()) == "Unknown":
+                code_languages.append("Not explicitly stated, unable to detect.")
+            else:
+                code_languages.append(f"Not explicitly stated. Best guess: "
+                                      f"{code_identifier.identify_language(block.strip()).capitalize()}")
+        return code_blocks, code_languages
+
+    def __str__(self):
+        num_lists, list_lengths = self.list_count()
+        tab = '    ' * (self.heading_level - 1)
+        internal_links, external_links = self.analyze_hyperlinks()
+        code_blocks, code_languages = self.analyze_code_blocks()
+        section_str = (
+            (f"{tab}Heading Level {self.heading_level} Title: {self.heading}\n") + \
+            (f"{tab}* Words: {self.word_count()}\n" if self.word_count() > 0 else "") + \
+            (f"{tab}* Bold Words: {self.bold_count()}\n" if self.bold_count() > 0 else "") + \
+            (f"{tab}* Sentences: {self.sentence_count()}\n" if self.sentence_count() > 0 else "") + \
+            (f"{tab}* Paragraphs: {self.paragraph_count()}\n" if self.paragraph_count() > 0 else "") + \
+            (f"{tab}* Italics: {self.italic_count()}\n" if self.italic_count() > 0 else "") + \
+            (f"{tab}* Inline Code Blocks: {self.inline_code_count()}\n" if self.inline_code_count() > 0 else "") + \
+            (f"{tab}* Block Quotes: {self.block_quote_count()}\n" if self.block_quote_count() > 0 else "") + \
+            (f"{tab}* Internal Links: {internal_links}\n" if internal_links else "") + \
+            (f"{tab}* External Links: {external_links}\n" if external_links else "") + \
+            (f"{tab}* Lists: {num_lists}\n" if num_lists > 0 else ""))
+        for i, length in enumerate(list_lengths, start=1):
+            section_str += f"{tab}   - Length of List {i}: {length}\n"
+        section_str += (f"{tab}* Code Blocks: {len(code_blocks)}\n" if len(code_blocks) > 0 else "")
+        for i, language in enumerate(code_languages, start=1):
+            section_str += f"{tab}   - Code Block {i}: Language - {language.capitalize()}\n"
+        if (len(internal_links) + len(external_links)) > self.word_count():
+            section_str += f"{tab}* There are too many hyperlinks in your input document, considering removing some.\n"
+        if self.word_count() > 0:
+            if self.italic_count()/self.word_count() > 0.08:
+                section_str += f"{tab}* There are too many italicized words in this section.\n"
+            if self.bold_count()/self.word_count() > 0.08:
+                section_str += f"{tab}* There are too many bolded words in this section.\n"
+        return section_str
+
+
+def load_sections(corpus=CORPUS):
+    """Splits every Markdown file of the corpus into (heading, level, content) tuples."""
+    sections = []
+    for root, _, files in os.walk(corpus):
+        for name in sorted(files):
+            if name.endswith('.md'):
+                split, _ = split_sections(read_markdown(os.path.join(root, name)))
+                sections.extend((s.heading, s.heading_level, s.raw_content) for s in split)
+    return sections
+
+
+def render(section_class, sections):
+    """Builds the report text of every section with the given section class."""
+    return [str(section_class(heading, level, content)) for heading, level, content in sections]
+
+
+def bench(section_class, sections, repeat):
+    """Returns the best wall time of building all section reports `repeat` times."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(section_class, sections)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(repeat=20):
+    sections = load_sections()
+    if render(LegacyMarkdownSection, sections) != render(MarkdownSection, sections):
+        sys.exit("Cached metrics produce a different report than the legacy implementation")
+
+    size = sum(len(content) for _, _, content in sections) / 1e6
+    legacy = bench(LegacyMarkdownSection, sections, repeat)
+    cached = bench(MarkdownSection, sections, repeat)
+    print(f"{len(sections)} sections, {size:.2f} MB of section content")
+    print(f"legacy (re-scan per metric): {legacy * 1000:8.2f} ms")
+    print(f"cached metrics record:       {cached * 1000:8.2f} ms")
+    print(f"speedup:                     {legacy / cached:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Startup-time benchmark: how long importing each analysis module takes in a fresh interpreter, and
+whether any of them pulls in PyQt5. Only launching the GUI should pay for Qt.
+
+Run from the project root:
+    python benchmarks/bench_startup.py [--repeat 5] [--budget-ms 100] [--check]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The analysis library, held to the import time budget. main is included: importing it must not import Qt
+CORE_MODULES = ('analysis', 'section', 'determine_language', 'conversion', 'report', 'repository', 'cache', 'main')
+
+# Command line tools, they load more of the standard library (asyncio, http.server) and are only checked for Qt
+TOOL_MODULES = ('batch', 'watch', 'aggregate', 'linkcheck', 'service')
+
+# Timed too when PyQt5 is installed, to show what the lazy import saves
+GUI_MODULES = ('gui',)
+
+# Run in the fresh interpreter: import time in seconds, and whether PyQt5 got imported
+PROBE = ("import sys, time; start = time.perf_counter(); import {module}; "
+         "print(time.perf_counter() - start, 'PyQt5' in sys.modules)")
+
+
+def probe(module):
+    """
+    Imports a module in a fresh interpreter.
+
+    Returns:
+        tuple: The import time in seconds and whether PyQt5 was imported, or None if the import failed.
+    """
+    result = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], cwd=ROOT, capture_output=True,
+                            text=True)
+    if result.returncode != 0:
+        return None
+    seconds, qt = result.stdout.split()
+    return float(seconds), qt == 'True'
+
+
+def slowest_imports(module, count=5):
+    """Returns the (cumulative microseconds, name) of the slowest imports below a module, from -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit() and name.strip() != module:
+                imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time importing every analysis module in a fresh interpreter.")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per module, the best run is kept")
+    parser.add_argument('--budget-ms', type=float, default=100, help="slowest import allowed for a core module")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 if a core module is over budget or any module imports Qt")
+    args = parser.parse_args(argv)
+
+    failures = []
+    print(f"{'module':20} {'import ms':>10}  PyQt5")
+    for module in CORE_MODULES + TOOL_MODULES + GUI_MODULES:
+        runs = [probe(module) for _ in range(args.repeat)]
+        if None in runs:
+            if module not in GUI_MODULES:
+                print(f"{module:20} {'failed':>10}")
+                failures.append(f"{module} cannot be imported")
+            else:
+                print(f"{module:20} {'skipped':>10}  (PyQt5 is not installed)")
+            continue
+        seconds = min(seconds for seconds, _ in runs)
+        qt = runs[0][1]
+        print(f"{module:20} {seconds * 1000:10.1f}  {'yes' if qt else 'no'}")
+        if module in GUI_MODULES:
+            continue
+        if qt:
+            failures.append(f"{module} imports PyQt5")
+        if module in CORE_MODULES and seconds * 1000 > args.budget_ms:
+            failures.append(f"{module} takes {seconds * 1000:.1f} ms to import, over the {args.budget_ms:g} ms budget")
+            for cumulative, name in slowest_imports(module):
+                failures.append(f"    {cumulative / 1000:8.1f} ms {name.strip()}")
+
+    if failures:
+        print("\n" + "\n".join(failures))
+    else:
+        print(f"\nNo module imports PyQt5, and every core module imports in under {args.budget_ms:g} ms.")
+    return 1 if failures and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
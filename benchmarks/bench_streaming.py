@@ -0,0 +1,94 @@
+"""
+Benchmarks the streaming section parser against loading the whole document on a synthetic
+Markdown file of 100 MB or more, reporting wall time and peak memory of each approach.
+
+Run from the project root:
+    python benchmarks/bench_streaming.py [--size-mb 100]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import analyze_file, iter_markdown_lines, stream_report
+
+# One synthetic section, repeated with a changing heading until the file reaches the target size
+SECTION_BODY = """
+Lorem ipsum dolor sit amet, **consectetur adipiscing** elit. Morbi mi eros, *maximus* ac nisl eget.
+Proin porttitor, `lectus ac mattis` dignissim, nulla risus [bibendum](https://example.com) libero.
+
+- item one
+- item two
+- item three
+
+> Suspendisse pellentesque faucibus vehicula.
+
+```python
+def example():
+    print("hello")
+```
+
+"""
+
+
+def write_synthetic_file(path, size_mb):
+    """Writes a synthetic Markdown file of at least size_mb megabytes, with one large section per chapter."""
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        chapter = 0
+        while written < target:
+            chapter += 1
+            block = f"# Chapter {chapter}\n" + SECTION_BODY * 50
+            for sub in range(1, 21):
+                block += f"## Topic {chapter}.{sub}\n" + SECTION_BODY * 3
+            f.write(block)
+            written += len(block)
+    return written
+
+
+def run_mode(mode, path):
+    """Analyzes the file with one approach in this process and prints seconds and peak memory in MB."""
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as out:
+        if mode == 'in-memory':
+            out.write(analyze_file(path).report())
+        else:
+            stream_report(iter_markdown_lines(path), os.path.basename(path), out)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    print(f"{elapsed} {peak_mb}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=100, help="size of the synthetic file")
+    parser.add_argument('--mode', choices=('in-memory', 'streaming'), help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.path)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.md')
+        size = write_synthetic_file(path, args.size_mb)
+        print(f"synthetic file: {size / 1024 / 1024:.1f} MB")
+        # Each approach runs in its own process so peak memory is measured independently
+        for mode in ('in-memory', 'streaming'):
+            output = subprocess.run([sys.executable, __file__, '--mode', mode, '--path', path],
+                                    capture_output=True, text=True, check=True).stdout
+            elapsed, peak_mb = map(float, output.split())
+            print(f"{mode:>10}: {elapsed:8.2f} s, peak memory {peak_mb:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Benchmark and regression suite timing every stage of the analysis separately, on the bundled
+`test files` corpus and on synthetic documents scaled up from it.
+
+Each run is appended to a JSON Lines history (benchmarks/history.jsonl by default) and compared
+with the previous runs of the same machine, so a stage that got slower is flagged.
+
+Run from the project root:
+    python benchmarks/bench_suite.py [--synthetic-mb 1 10] [--repeat 5] [--threshold 0.2] [--check]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from analysis import ANALYZER_VERSION, DocumentAnalysis, split_sections
+from conversion import filetype_convert, plain_text_types
+from determine_language import code_identifier
+from markdown_frontend import tokenize
+from scanner import scan
+from section import SectionMetrics
+
+CORPUS = os.path.join(ROOT, 'test files')
+HISTORY = os.path.join(ROOT, 'benchmarks', 'history.jsonl')
+
+# Stages faster than this are too noisy to be flagged as regressions
+NOISE_FLOOR = 0.001
+
+
+def best_time(function, repeat):
+    """Returns the best wall time of `repeat` calls of function, with the garbage collector paused."""
+    best = float('inf')
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def load_corpus(corpus=CORPUS):
+    """
+    Reads the corpus files the analyzer supports.
+
+    Returns:
+        tuple: The Markdown documents as (file name, lines), and the paths of the files needing conversion.
+    """
+    documents = []
+    converted = []
+    for root, _, files in os.walk(corpus):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            extension = os.path.splitext(name)[-1].lower()
+            if extension == '.md':
+                with open(path, 'r', encoding='utf-8') as file:
+                    documents.append((name, file.readlines()))
+            elif extension in ('.docx', '.html') + plain_text_types:
+                converted.append(path)
+    return documents, converted
+
+
+def synthetic_documents(documents, size_mb):
+    """Builds one document of at least size_mb megabytes by repeating the corpus with renumbered headings."""
+    target = size_mb * 1024 * 1024
+    lines = []
+    written = 0
+    copy = 0
+    while written < target:
+        copy += 1
+        for _, document in documents:
+            for line in document:
+                if line.startswith('#'):
+                    # Keeps headings unique so no two sections of the copies are identical
+                    line = f"{line.rstrip()} ({copy})\n"
+                lines.append(line)
+                written += len(line)
+    return [(f"synthetic-{size_mb}mb.md", lines)]
+
+
+def time_conversion(paths, repeat):
+    """Times filetype_convert over the files needing conversion, or returns None if none of them converts."""
+    convertible = [path for path in paths
+                   if os.path.splitext(path)[-1].lower() in plain_text_types or shutil.which('pandoc')]
+    if not convertible:
+        return None, 0
+    size = sum(os.path.getsize(path) for path in convertible)
+    return best_time(lambda: [filetype_convert(path) for path in convertible], repeat), size
+
+
+def time_metrics(contents, repeat):
+    """Times the Markdown frontend and every metric computed from the raw content or the tokens, on every section."""
+    timings = {
+        'tokenize': best_time(lambda: [tokenize(content) for content in contents], repeat),
+        'metric.words': best_time(lambda: [len(content.split()) for content in contents], repeat),
+        'metric.paragraphs': best_time(
+            lambda: [sum(1 for p in content.split('\n\n') if p.strip()) for content in contents], repeat),
+    }
+    scans = [scan(content) for content in contents]
+    for tokens in scans:
+        tokens.tokens('bold') # Tokenizes once, the metrics below only read the tokens
+    timings['metric.bold'] = best_time(lambda: [SectionMetrics._bold_words(tokens.tokens('bold')) for tokens in scans], repeat)
+    timings['metric.list_lengths'] = best_time(
+        lambda: [SectionMetrics._list_lengths(tokens.tokens('list_item'), tokens.text) for tokens in scans], repeat)
+    timings['metrics.record'] = best_time(
+        lambda: [SectionMetrics.from_content(content) for content in contents], repeat)
+    return timings
+
+
+def time_language_detection(contents, repeat):
+    """Times the language detection of every code block of the sections."""
+    blocks = [token.value.strip() for content in contents for token in scan(content).tokens('code_block')]
+    return best_time(lambda: code_identifier.identify_languages(blocks), repeat), len(blocks)
+
+
+def time_rendering(documents, repeat):
+    """Times building the report model of every document and rendering it as text, JSON and CSV."""
+    analyses = []
+    for name, lines in documents:
+        sections, heading_level_count = split_sections(lines)
+        analyses.append(DocumentAnalysis(name, sections, heading_level_count))
+    for analysis in analyses:
+        for section in analysis.sections:
+            section.metrics # Metrics are timed separately, rendering starts from filled records
+    reports = [analysis.to_report() for analysis in analyses]
+    return {
+        'render.model': best_time(lambda: [analysis.to_report() for analysis in analyses], repeat),
+        'render.text': best_time(lambda: [report.to_text() for report in reports], repeat),
+        'render.json': best_time(lambda: [report.to_json() for report in reports], repeat),
+        'render.csv': best_time(lambda: [report.to_csv() for report in reports], repeat),
+    }
+
+
+def run_dataset(documents, repeat, converted=()):
+    """
+    Times every stage of the analysis on one dataset.
+
+    Args:
+        documents (list): The Markdown documents as (file name, lines).
+        repeat (int): Number of runs of each stage, the best one is kept.
+        converted (list): Paths of files whose conversion is timed too.
+
+    Returns:
+        dict: The size of the dataset and the best time in seconds of every stage.
+    """
+    size = sum(len(line) for _, lines in documents for line in lines)
+    stages = {}
+    conversion, converted_size = time_conversion(converted, repeat)
+    if conversion is not None:
+        stages['conversion'] = conversion
+
+    stages['split_sections'] = best_time(lambda: [split_sections(lines) for _, lines in documents], repeat)
+
+    contents = [section.raw_content for _, lines in documents for section in split_sections(lines)[0]]
+    stages.update(time_metrics(contents, repeat))
+    stages['language_detection'], code_blocks = time_language_detection(contents, repeat)
+    stages.update(time_rendering(documents, repeat))
+    return {'bytes': size, 'converted_bytes': converted_size, 'documents': len(documents),
+            'sections': len(contents), 'code_blocks': code_blocks, 'stages': stages}
+
+
+def git_commit():
+    """Returns the short hash of the checked out commit, or None outside of a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path):
+    """Returns the runs recorded in a history file, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def find_regressions(run, history, threshold, baseline_runs=5):
+    """
+    Compares a run with the median of the previous runs of the same machine.
+
+    Returns:
+        list: (dataset, stage, seconds, baseline seconds) of every stage more than `threshold` slower.
+    """
+    previous = [entry for entry in history if entry.get('machine') == run['machine']][-baseline_runs:]
+    regressions = []
+    for dataset, result in run['datasets'].items():
+        for stage, seconds in result['stages'].items():
+            baseline = [entry['datasets'][dataset]['stages'][stage] for entry in previous
+                        if stage in entry['datasets'].get(dataset, {}).get('stages', {})]
+            if not baseline:
+                continue
+            median = statistics.median(baseline)
+            if seconds > median * (1 + threshold) and seconds - median > NOISE_FLOOR:
+                regressions.append((dataset, stage, seconds, median))
+    return regressions
+
+
+def print_run(run):
+    for dataset, result in run['datasets'].items():
+        print(f"\n{dataset}: {result['documents']} documents, {result['sections']} sections, "
+              f"{result['code_blocks']} code blocks, {result['bytes'] / 1e6:.2f} MB")
+        for stage, seconds in result['stages'].items():
+            size = result['converted_bytes'] if stage == 'conversion' else result['bytes']
+            rate = f"{size / 1e6 / seconds:10.1f} MB/s" if seconds else ""
+            print(f"  {stage:24} {seconds * 1000:10.2f} ms {rate}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every analysis stage and flag regressions.")
+    parser.add_argument('--synthetic-mb', type=int, nargs='*', default=[1, 10],
+                        help="sizes of the synthetic documents, in MB")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of each stage, the best one is kept")
+    parser.add_argument('--history', default=HISTORY, help="JSON Lines file the runs are appended to")
+    parser.add_argument('--threshold', type=float, default=0.2, help="slowdown flagged as a regression, 0.2 = 20%%")
+    parser.add_argument('--no-save', action='store_true', help="compare with the history without appending this run")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 if a regression is flagged")
+    args = parser.parse_args(argv)
+
+    documents, converted = load_corpus()
+    datasets = {'corpus': run_dataset(documents, args.repeat, converted)}
+    for size_mb in args.synthetic_mb:
+        datasets[f'synthetic-{size_mb}mb'] = run_dataset(synthetic_documents(documents, size_mb), args.repeat)
+
+    run = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'analyzer_version': ANALYZER_VERSION,
+        'python': platform.python_version(),
+        'machine': f"{platform.node()} {platform.machine()}",
+        'repeat': args.repeat,
+        'datasets': datasets,
+    }
+    print_run(run)
+
+    history = read_history(args.history)
+    regressions = find_regressions(run, history, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions against the median of the previous runs:")
+        for dataset, stage, seconds, baseline in regressions:
+            print(f"  {dataset} {stage}: {seconds * 1000:.2f} ms, was {baseline * 1000:.2f} ms "
+                  f"(+{(seconds / baseline - 1) * 100:.0f}%)")
+    elif history:
+        print("\nNo regressions against the previous runs.")
+
+    if not args.no_save:
+        with open(args.history, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(run) + '\n')
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+class AnalysisCache:
+    """
+    On-disk content-addressed cache of converted Markdown and analysis results.
+
+    Entries are keyed by the SHA-256 of the input file content together with the version of the
+    code that produced them, so editing a file or upgrading the analyzer or converter never returns
+    a stale entry. The cache is bounded in size and evicts the least recently used entries first.
+
+    Once the cache grows past max_bytes, eviction trims it down to `low_water` of max_bytes, so the
+    directory is only scanned again after that much has been written. The size is tracked by each
+    AnalysisCache instance from its own writes, and every eviction measures the directory again. So
+    when several processes share one cache directory, e.g. the batch workers, each one only notices
+    the limit through its own writes. The directory can then exceed max_bytes by up to what the
+    other processes wrote since their last eviction.
+
+    Attributes:
+        directory (str): The directory holding the cache entries.
+        max_bytes (int): The size above which least recently used entries are evicted.
+        low_water (float): Fraction of max_bytes the cache is trimmed down to when it is evicted.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found no entry.
+        bytes_saved (int): Input bytes whose conversion or analysis was skipped thanks to a hit.
+    """
+
+    def __init__(self, directory='./cache', max_bytes=256 * 1024 * 1024, low_water=0.8):
+        """
+        Initializes an instance of the AnalysisCache class, creating its directory if missing.
+
+        Args:
+            directory (str): The directory holding the cache entries.
+            max_bytes (int): The size above which least recently used entries are evicted.
+            low_water (float): Fraction of max_bytes the cache is trimmed down to when it is evicted.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory)
+                         if entry.is_file() and entry.name.endswith('.json'))
+
+    @staticmethod
+    def digest(content):
+        """Returns the content hash of a file's bytes."""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def file_digest(path, chunk_size=1024 * 1024):
+        """Returns the content hash of a file, the same as `digest` of its bytes, reading it in chunks."""
+        content_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def _path(self, kind, version, content_digest):
+        """Returns the entry path of a kind of result produced by a code version for some content."""
+        key = hashlib.sha256(f"{kind}\0{version}\0{content_digest}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, kind, version, content_digest, content_size=0):
+        """
+        Looks up a cached result.
+
+        Args:
+            kind (str): The kind of result, e.g. 'markdown' or 'analysis'.
+            version (str): Version of the code that produces this kind of result.
+            content_digest (str): The content hash of the input file.
+            content_size (int): Size of the input file, counted in bytes_saved on a hit.
+
+        Returns:
+            The cached JSON value, or None on a miss.
+        """
+        path = self._path(kind, version, content_digest)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += content_size
+        return value
+
+    def has(self, kind, version, content_digest):
+        """Returns whether a result is cached, without reading it or counting a hit or miss."""
+        return os.path.exists(self._path(kind, version, content_digest))
+
+    def put(self, kind, version, content_digest, value):
+        """Stores a JSON-serializable result, then evicts old entries if the cache is too big."""
+        path = self._path(kind, version, content_digest)
+        data = json.dumps(value).encode('utf-8')
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - previous_size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in its low water mark, measuring the directory."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+        with self._lock:
+            self._size = size
+
+    def clear(self):
+        """Removes every cache entry."""
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.json'):
+                os.remove(entry.path)
+        with self._lock:
+            self._size = 0
+
+    def stats(self):
+        """Returns the hit, miss, bytes saved and size statistics of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes_saved': self.bytes_saved,
+                'size': self._size,
+                'max_bytes': self.max_bytes,
+            }
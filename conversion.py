@@ -0,0 +1,285 @@
+import functools
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from instrumentation import instrument
+
+# Pandoc input format for every supported file extension
+accepted_types = { #dict
+    '.docx': 'docx',
+    '.html': 'html',
+    '.txt': 'markdown'
+    #Add future filetypes here 
+    #Refer to pandoc github readme
+}
+
+# Version of the conversion code, bump it whenever the converted Markdown changes
+CONVERTER_VERSION = "1"
+
+# Extensions whose content is already Markdown and is read directly instead of going through pandoc
+plain_text_types = ('.txt',)
+
+# Seconds after which a pandoc conversion is killed, a hung pandoc must not block an analysis forever
+CONVERSION_TIMEOUT = 60
+
+
+def needs_pandoc(md_input):
+    """Returns whether a file is converted to Markdown by pandoc."""
+    filetype = os.path.splitext(md_input)[-1].lower()
+    return filetype in accepted_types and filetype not in plain_text_types
+
+
+def conversion_error(error):
+    """Returns a short message for an exception raised by a conversion, with pandoc's own message if it has one."""
+    if isinstance(error, FileNotFoundError):
+        return "pandoc is not installed"
+    if isinstance(error, subprocess.CalledProcessError) and error.stderr and error.stderr.strip():
+        return f"pandoc failed: {error.stderr.strip()}"
+    if isinstance(error, subprocess.TimeoutExpired):
+        return f"pandoc took longer than {error.timeout:g} s and was stopped"
+    return str(error) or type(error).__name__
+
+
+def read_plain_text(md_input):
+    """Pure-Python fast path: reads a plain text file that is already Markdown."""
+    with open(md_input, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+@functools.lru_cache(maxsize=None)
+def converter_version():
+    """Returns the version of the conversion code and of the installed pandoc, e.g. for cache keys."""
+    try:
+        result = subprocess.run(['pandoc', '--version'], capture_output = True, text = True)
+        pandoc = result.stdout.split('\n', 1)[0].strip()
+    except OSError:
+        pandoc = "pandoc unavailable"
+    return f"{CONVERTER_VERSION}/{pandoc}"
+
+
+def run_pandoc(md_input, file_format, timeout=None):
+    """
+    Converts a file to Markdown with one pandoc process.
+
+    Args:
+        md_input (str): Path of the file to convert.
+        file_format (str): The pandoc input format.
+        timeout (float): Seconds after which the pandoc process is killed, None to wait forever.
+
+    Returns:
+        str: The converted Markdown.
+
+    Raises:
+        FileNotFoundError: If pandoc is not installed.
+        subprocess.TimeoutExpired: If the conversion took longer than the timeout.
+        subprocess.CalledProcessError: If pandoc failed, with its error message in `stderr`.
+    """
+    result = subprocess.run(['pandoc', '--from', file_format, '--to', 'markdown',
+                             md_input], capture_output = True, text = True, timeout = timeout, check = True)
+    return result.stdout
+
+
+def iter_converted_lines(md_input, timeout=None):
+    """
+    Converts a file to Markdown and yields the lines as pandoc writes them, without holding the whole output.
+
+    Args:
+        md_input (str): Path of the file to convert.
+        timeout (float): Seconds after which pandoc is killed if it has not finished, None to wait forever.
+
+    Yields:
+        str: Each converted Markdown line, with its line ending.
+
+    Raises:
+        ValueError: If the file type is not supported.
+        FileNotFoundError: If pandoc is not installed.
+        subprocess.CalledProcessError: If pandoc failed, with its error message in `stderr`. The lines
+            converted before the failure have already been yielded.
+        subprocess.TimeoutExpired: If pandoc was killed after the timeout.
+    """
+    filetype = os.path.splitext(md_input)[-1].lower()
+    file_format = accepted_types.get(filetype)
+    if file_format is None:
+        raise ValueError(f'Invalid file type {filetype}')
+
+    if filetype in plain_text_types:
+        with open(md_input, 'r', encoding='utf-8') as file:
+            yield from file
+        return
+
+    # Errors go to a file rather than a pipe, pandoc would block on a full stderr pipe nobody reads
+    import tempfile # Only streaming pandoc needs it, it is slow to import
+    args = ['pandoc', '--from', file_format, '--to', 'markdown', md_input]
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as stderr:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        # A hung pandoc may never write or close its output, so it is killed from a timer thread
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, expire) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            yield from process.stdout
+            process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            # Stop pandoc if the consumer stopped reading early
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if expired.is_set():
+            raise subprocess.TimeoutExpired(args, timeout)
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, args, stderr=stderr.read())
+
+
+# Pandoc file type conversion
+@instrument('conversion', size=lambda converted, md_input: len(converted) if converted else 0)
+def filetype_convert(md_input):
+    filetype = os.path.splitext(md_input)[-1].lower()
+    
+    file_formats = accepted_types.get(filetype)
+    if file_formats is None:
+        raise ValueError(f'Invalid file type {filetype}')
+    
+    try: 
+        if filetype in plain_text_types:
+            return read_plain_text(md_input)
+        converted_markdown = run_pandoc(md_input, file_formats, CONVERSION_TIMEOUT)
+        return converted_markdown
+    
+    #Error processing
+    except FileNotFoundError:
+        print("Pandoc execution failed: Is pandoc installed? Try 'pandoc --version'") 
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as error:
+        print(f"Error. File {md_input} failed due to: {conversion_error(error)}")
+        return None
+    except Exception as error:
+        print(f"Error. File {md_input} failed due to: {error}")
+        return None
+
+
+class ConversionPool:
+    """
+    Bounded pool of pandoc workers converting files to Markdown concurrently.
+
+    Pandoc cannot serve several documents from one process, so each worker thread runs one pandoc
+    process at a time and the pool bounds how many run at once. Plain text files skip pandoc.
+
+    Attributes:
+        max_workers (int): The maximum number of conversions running at once.
+        timeout (float): Seconds after which a single pandoc conversion is killed.
+    """
+
+    def __init__(self, max_workers=None, timeout=CONVERSION_TIMEOUT, latency_window=1000):
+        """
+        Initializes an instance of the ConversionPool class.
+
+        Args:
+            max_workers (int): The maximum number of conversions running at once, defaults to the number of cores.
+            timeout (float): Seconds after which a single pandoc conversion is killed.
+            latency_window (int): Number of most recent conversion latencies kept for the statistics.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        # Imported here, most analyses never start a pool and importing it is a good part of the startup time
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pandoc')
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._latencies = deque(maxlen=latency_window)
+
+    @instrument('conversion', size=lambda converted, self, md_input: len(converted))
+    def _convert(self, md_input):
+        """Converts one file on a worker thread and records its latency."""
+        filetype = os.path.splitext(md_input)[-1].lower()
+        file_format = accepted_types.get(filetype)
+        if file_format is None:
+            raise ValueError(f'Invalid file type {filetype}')
+
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            if filetype in plain_text_types:
+                converted_markdown = read_plain_text(md_input)
+            else:
+                converted_markdown = run_pandoc(md_input, file_format, self.timeout)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return converted_markdown
+        finally:
+            latency = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._latencies.append(latency)
+
+    def submit(self, md_input):
+        """Schedules the conversion of a file and returns a Future of its Markdown."""
+        return self._executor.submit(self._convert, md_input)
+
+    def convert(self, md_input):
+        """Converts a file and waits for its Markdown."""
+        return self.submit(md_input).result()
+
+    def convert_many(self, paths):
+        """Converts files concurrently and yields (path, Markdown or exception) in input order."""
+        futures = [(path, self.submit(path)) for path in paths]
+        for path, future in futures:
+            try:
+                yield path, future.result()
+            except Exception as error:
+                yield path, error
+
+    async def convert_async(self, md_input):
+        """Converts a file from asyncio code without blocking the event loop."""
+        import asyncio # Only asyncio callers pay for importing it, it is most of the import time of this module
+        return await asyncio.wrap_future(self.submit(md_input))
+
+    @property
+    def in_flight(self):
+        """The number of conversions currently running."""
+        return self._in_flight
+
+    def stats(self):
+        """Returns the conversion counts and latency statistics (in seconds) used to size the pool."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'max_workers': self.max_workers,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'failed': self._failed,
+            }
+        if latencies:
+            stats['latency_mean'] = sum(latencies) / len(latencies)
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+    def close(self):
+        """Waits for the running conversions and shuts the workers down."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,23 +1,115 @@
+import re
+
+
 class CodeLanguageIdentifier:
     """
     Identifies the programming language of a code block.
 
-    Looks for the presence of specific keywords unique to each programming language.
+    Looks for the presence of specific keywords unique to each programming language. Every keyword
+    of every language is compiled into one multi-pattern matcher, a regular expression shaped like
+    a trie of the keywords, so scoring a code block is a single pass over it whatever the number of
+    languages and keywords.
 
     Attributes:
         languages_patterns (dict): A dictionary mapping programming languages to lists
                                     of unique keywords and syntax patterns associated with each language.
+                                    Keywords are plain strings, syntax patterns are compiled regular expressions.
     """
     def __init__(self):
         self.languages_patterns = {
             #'Python': ['def ', 'import ', 'from ', 'class ', ':', 'print(', 'lambda '],
-            'Python': ['def ', 'import ', 'from ', 'class ', r'(?<!:):(?!:)', 'print(', 'lambda '],
+            'Python': ['def ', 'import ', 'from ', 'class ', re.compile(r'(?<!:):(?!:)'), 'print(', 'lambda '],
             'JavaScript': ['function ', '=>', 'var ', 'let ', 'const ', 'console.log('],
             'Java': ['public class', 'public static void main', 'import java.', 'new '],
             'C++': ['#include ', 'int main()', 'std::', 'cout <<', 'cin >>'],
             'Rust': ['fn ', 'let ', 'mut ', 'match ', 'trait ', 'enum '],
             'Kotlin': ['fun ', 'val ', 'var ', 'println(', 'import '],
         }
+        self._compile()
+
+    def add_language(self, language, patterns):
+        """
+        Adds a language, or replaces its patterns, and recompiles the matcher.
+
+        Args:
+            language (str): Name of the language.
+            patterns (list): Its keywords (str) and syntax patterns (compiled regular expressions).
+        """
+        self.languages_patterns[language] = list(patterns)
+        self._compile()
+
+    def _compile(self):
+        """Compiles every keyword into one trie-shaped regular expression."""
+        self._languages = list(self.languages_patterns)
+        self._keyword_languages = {} # keyword -> indices of the languages having it
+        self._regex_languages = [] # (compiled syntax pattern, index of its language)
+        for index, language in enumerate(self._languages):
+            for pattern in self.languages_patterns[language]:
+                if isinstance(pattern, re.Pattern):
+                    self._regex_languages.append((pattern, index))
+                else:
+                    self._keyword_languages.setdefault(pattern, []).append(index)
+
+        # A keyword is found wherever a longer keyword it is a prefix of is found
+        self._found_with = {
+            keyword: [prefix for prefix in self._keyword_languages if keyword.startswith(prefix)]
+            for keyword in self._keyword_languages
+        }
+        trie = {}
+        for keyword in self._keyword_languages:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = True # End of a keyword
+        # The lookahead reports the longest keyword starting at every position, even overlapping ones
+        self._matcher = re.compile(f'(?=({self._trie_regex(trie)}))') if trie else None
+
+    @classmethod
+    def _trie_regex(cls, node):
+        """Returns the regular expression matching the longest keyword of a trie node."""
+        branches = [re.escape(char) + cls._trie_regex(child) for char, child in node.items() if char]
+        if not branches:
+            return ''
+        regex = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional group: prefer the longer keyword, fall back to the one ending here
+        return f'(?:{regex})?' if '' in node else regex
+
+    def scores(self, code_block):
+        """
+        Counts how many of each language's keywords and syntax patterns appear in a code block.
+
+        Args:
+            code_block (str): The code block string
+
+        Returns:
+            dict: The number of matched patterns of every language.
+        """
+        found = set()
+        if self._matcher is not None:
+            for keyword in set(self._matcher.findall(code_block)):
+                found.update(self._found_with[keyword])
+
+        counts = [0] * len(self._languages)
+        for keyword in found:
+            for index in self._keyword_languages[keyword]:
+                counts[index] += 1
+        for pattern, index in self._regex_languages:
+            if pattern.search(code_block):
+                counts[index] += 1
+        return dict(zip(self._languages, counts))
+
+    def confidence(self, code_block):
+        """
+        Scores a code block against every language.
+
+        Args:
+            code_block (str): The code block string
+
+        Returns:
+            dict: For every language, the fraction of its patterns found in the code block, from 0 to 1.
+        """
+        return {language: count / len(self.languages_patterns[language]) if self.languages_patterns[language] else 0.0
+                for language, count in self.scores(code_block).items()}
 
     def identify_language(self, code_block):
         """
@@ -29,12 +121,7 @@ class CodeLanguageIdentifier:
         Returns:
             str: The language with the highest score or, if there is no match, it returns "Unknown".
         """
-        scores = {language: 0 for language in self.languages_patterns}
-
-        for language, patterns in self.languages_patterns.items():
-            for pattern in patterns:
-                if pattern in code_block:
-                    scores[language] += 1
+        scores = self.scores(code_block)
 
         # find highest score
         identified_language = max(scores, key=scores.get)
@@ -43,4 +130,18 @@ class CodeLanguageIdentifier:
 
         return identified_language
 
+    def identify_languages(self, code_blocks):
+        """
+        Identifies the programming language of many code blocks at once.
+
+        Args:
+            code_blocks (iterable): The code block strings
+
+        Returns:
+            list: The identified language, or "Unknown", of every code block, in order.
+        """
+        return [self.identify_language(code_block) for code_block in code_blocks]
+
 
+# Shared identifier, so the patterns are compiled once rather than for every section
+code_identifier = CodeLanguageIdentifier()
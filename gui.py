@@ -1,7 +1,7 @@
-from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QTextEdit, QLabel
-from PyQt5.QtWidgets import * 
-from PyQt5.QtGui import * 
-from PyQt5.QtCore import * 
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QObject, QRunnable, Qt, pyqtSignal
+from PyQt5.QtWidgets import (QAbstractItemView, QHBoxLayout, QLabel, QListView, QProgressBar, QPushButton, QSplitter,
+                             QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWidget)
+from analysis import AnalysisCancelled, analyze_file
 
 class GUI(QWidget):
     def __init__(self):
@@ -23,9 +23,15 @@ class GUI(QWidget):
         label = QLabel('Analysis Report')
         main_layout.addWidget(label)
 
-        # Adds the text area to display reports
-        self.text = QTextEdit()  # Allows for multi-line input or display
-        main_layout.addWidget(self.text)
+        # Adds the report viewer, which renders sections only as they are scrolled into view
+        self.viewer = ReportViewer()
+        main_layout.addWidget(self.viewer)
+
+        # Adds the progress of the running analysis, in sections
+        self.progress = QProgressBar()
+        self.progress.setFormat('%v / %m sections')
+        self.progress.setVisible(False)
+        main_layout.addWidget(self.progress)
 
         # Adds a horizontal layout to the vertical layout for the buttons
         button_layout = QHBoxLayout()
@@ -54,6 +60,18 @@ class GUI(QWidget):
         self.history_button = QPushButton('View Report History')
         layout.addWidget(self.history_button, alignment=Qt.AlignCenter)
 
+        self.cancel_button = QPushButton('Cancel Analysis')
+        self.cancel_button.setEnabled(False)
+        layout.addWidget(self.cancel_button, alignment=Qt.AlignCenter)
+
+    def set_busy(self, busy):
+        # Disables starting another analysis while one is running, and shows its progress
+        self.select_button.setEnabled(not busy)
+        self.cancel_button.setEnabled(busy)
+        self.progress.setVisible(busy)
+        if busy:
+            self.progress.setRange(0, 0)  # Busy indicator until the number of sections is known
+
 
     def styles(self):
         self.setStyleSheet("""
@@ -74,7 +92,20 @@ class GUI(QWidget):
         QPushButton:pressed {
             background-color: #3675b6;
         }
-        QTextEdit {
+        QPushButton:disabled {
+            background-color: #5a5a5a;
+            color: #999999;
+        }
+        QProgressBar {
+            background-color: #1e1e1e;
+            color: #FFFFFF;
+            text-align: center;
+            border-radius: 3px;
+        }
+        QProgressBar::chunk {
+            background-color: #2d6198;
+        }
+        QTreeWidget, QListView, QLabel#reportHeader {
             background-color: #1e1e1e;
             color: #FFFFFF;
             font-size: 14px;
@@ -83,3 +114,213 @@ class GUI(QWidget):
         """)
 
 
+class LiveReport:
+    """
+    Report source filled section by section while an analysis runs, or holding a single message.
+
+    Has the same interface as report.DocumentReport and report.ReportFile.
+    """
+
+    def __init__(self, header=''):
+        self.header = header
+        self.sections = []  # (heading level, heading, text) of every section received so far
+
+    def header_text(self):
+        return self.header
+
+    def headings(self):
+        return [(level, heading) for level, heading, _ in self.sections]
+
+    def section_text(self, index):
+        return self.sections[index][2]
+
+    def to_text(self):
+        return self.header + '\n\n'.join(text for _, _, text in self.sections)
+
+
+class ReportSectionModel(QAbstractListModel):
+    """
+    List model of the sections of a report source, one row per section.
+
+    Rows are exposed in batches through canFetchMore/fetchMore, so the view only asks for the
+    sections the user scrolls to, and each section is rendered when its row is first displayed.
+    """
+    batch_size = 50
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.loaded = 0  # Number of rows exposed to the view so far
+        self._total = len(source.headings())
+        self._texts = {}  # Rendered text of the rows displayed so far
+
+    def total(self):
+        return self._total
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < self.total()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.batch_size, self.total() - self.loaded)
+        if count > 0:
+            self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+            self.loaded += count
+            self.endInsertRows()
+
+    def fetch_until(self, row):
+        # Loads every batch up to the given row, e.g. before jumping to it from the heading tree
+        while self.loaded <= row and self.canFetchMore():
+            self.fetchMore()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        row = index.row()
+        text = self._texts.get(row)
+        if text is None:
+            text = self._texts[row] = self.source.section_text(row).rstrip('\n')
+        return text
+
+    def section_added(self):
+        # Called after a LiveReport received a section, shows it right away if every previous row is loaded
+        self._total += 1
+        if self.loaded == self._total - 1:
+            self.fetchMore()
+
+
+class ReportViewer(QWidget):
+    """
+    Report viewer: a collapsible tree of the headings next to a lazily rendered list of the sections.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.source = LiveReport()
+        self._tree_parents = []  # (heading level, tree item) of the headings the next heading may nest under
+
+        self.header = QLabel()
+        self.header.setObjectName('reportHeader')
+        self.header.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.header.setWordWrap(True)
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.itemClicked.connect(self.show_heading)
+
+        self.sections = QListView()
+        self.sections.setWordWrap(True)
+        self.sections.setUniformItemSizes(False)
+        self.sections.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        # Lays rows out in batches so huge reports never measure every row at once
+        self.sections.setLayoutMode(QListView.Batched)
+        self.sections.setBatchSize(ReportSectionModel.batch_size)
+        self.model = ReportSectionModel(self.source)
+        self.sections.setModel(self.model)
+
+        splitter = QSplitter()
+        splitter.addWidget(self.tree)
+        splitter.addWidget(self.sections)
+        splitter.setStretchFactor(1, 3)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.header)
+        layout.addWidget(splitter)
+        self.setLayout(layout)
+
+    def set_source(self, source):
+        # Shows another report source, closing the memory map of a previously opened report file
+        if hasattr(self.source, 'close'):
+            self.source.close()
+        self.source = source
+        self.model = ReportSectionModel(source)
+        self.sections.setModel(self.model)
+        self.header.setText(source.header_text().strip())
+        self.tree.clear()
+        self._tree_parents = []
+        for row, (level, heading) in enumerate(source.headings()):
+            self._add_heading(row, level, heading)
+
+    def _add_heading(self, row, level, heading):
+        # Nests the heading under the closest previous heading of a lower level, in one pass over the headings
+        while self._tree_parents and self._tree_parents[-1][0] >= level:
+            self._tree_parents.pop()
+        parent = self._tree_parents[-1][1] if self._tree_parents else self.tree
+        item = QTreeWidgetItem(parent, [heading])
+        item.setData(0, Qt.UserRole, row)
+        self._tree_parents.append((level, item))
+
+    def show_message(self, message):
+        self.set_source(LiveReport(message))
+
+    def begin_live(self):
+        self.set_source(LiveReport())
+
+    def append_section(self, level, heading, text):
+        # Adds a section received from a running analysis
+        self.source.sections.append((level, heading, text))
+        self._add_heading(len(self.source.sections) - 1, level, heading)
+        self.model.section_added()
+
+    def show_heading(self, item):
+        row = item.data(0, Qt.UserRole)
+        self.model.fetch_until(row)
+        self.sections.scrollTo(self.model.index(row), QAbstractItemView.PositionAtTop)
+
+    def to_text(self):
+        return self.source.to_text()
+
+
+class AnalysisSignals(QObject):
+    # Signals of an AnalysisWorker, a QRunnable cannot define signals itself
+    section_ready = pyqtSignal(int, int, int, str, str)  # Sections done, total sections, heading level, heading, text
+    finished = pyqtSignal(object)  # report.DocumentReport
+    failed = pyqtSignal(str)  # Error message
+    cancelled = pyqtSignal()
+
+
+class AnalysisWorker(QRunnable):
+    """
+    Analyzes a file on a QThreadPool thread so the GUI stays responsive.
+
+    Progress is reported section by section through `signals`, which Qt delivers on the GUI thread,
+    and `cancel` stops the analysis before the next section.
+    """
+
+    def __init__(self, filepath, cache=None, repository=None):
+        super().__init__()
+        self.filepath = filepath
+        self.cache = cache
+        self.repository = repository
+        self.signals = AnalysisSignals()
+        self._cancelled = False
+
+    def cancel(self):
+        # Read by the worker thread after every section
+        self._cancelled = True
+
+    def _progress(self, section, done, total):
+        if self._cancelled:
+            raise AnalysisCancelled()
+        self.signals.section_ready.emit(done, total, section.heading_level, section.heading, str(section))
+
+    def run(self):
+        try:
+            analysis = analyze_file(self.filepath, self.cache, self._progress)
+            if analysis is None:
+                self.signals.failed.emit(f"Could not convert {self.filepath}")
+                return
+            report = analysis.to_report()
+            if self.repository is not None:
+                self.repository.save(report.to_text(), analysis.file_name, self.filepath, analysis.content_hash, analysis.totals())
+        except AnalysisCancelled:
+            self.signals.cancelled.emit()
+        except Exception as error:
+            self.signals.failed.emit(str(error))
+        else:
+            self.signals.finished.emit(report)
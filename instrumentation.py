@@ -0,0 +1,121 @@
+"""
+Opt-in instrumentation of the analysis stages: wall time, call count and bytes processed.
+
+Instrumentation is off by default. Turn it on with `enable()`, or by setting the environment
+variable COURSE_COMPANION_PROFILE=1 before the modules are imported. While it is off, an
+instrumented function costs one extra call and one flag check, nothing is timed or recorded.
+
+Stages are named after what they measure, e.g. 'conversion', 'split_sections', 'scan.bold',
+'report.text' or 'repository.save'. The recorded stages are exported as a per-run summary with
+`summary()` / `format_summary()`, or in the Prometheus text format with `to_prometheus()`.
+"""
+import functools
+import os
+import threading
+import time
+
+# Whether the instrumented functions record anything, read on every call
+enabled = os.environ.get('COURSE_COMPANION_PROFILE', '') not in ('', '0')
+
+# stage name -> [calls, seconds, bytes]
+_stages = {}
+_lock = threading.Lock()
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = 'course_companion_stage'
+
+
+def enable():
+    """Starts recording the instrumented stages."""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stops recording, the stages recorded so far are kept."""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forgets every recorded stage, e.g. at the start of a run."""
+    with _lock:
+        _stages.clear()
+
+
+def record(stage, seconds, size=0, calls=1):
+    """Adds a measurement to a stage."""
+    with _lock:
+        values = _stages.get(stage)
+        if values is None:
+            values = _stages[stage] = [0, 0.0, 0]
+        values[0] += calls
+        values[1] += seconds
+        values[2] += size
+
+
+def instrument(stage, size=None):
+    """
+    Decorator recording the wall time of every call of a function while instrumentation is enabled.
+
+    Args:
+        stage (str or callable): Name of the stage, or a function of the call arguments returning it.
+        size (callable): Called as size(result, *args, **kwargs), returns the bytes processed by the call.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            name = stage(*args, **kwargs) if callable(stage) else stage
+            record(name, seconds, size(result, *args, **kwargs) if size else 0)
+            return result
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+    Returns the recorded stages.
+
+    Returns:
+        dict: stage name -> calls, seconds, bytes and mean seconds per call, sorted by stage name.
+    """
+    with _lock:
+        stages = {stage: list(values) for stage, values in _stages.items()}
+    return {stage: {'calls': calls, 'seconds': seconds, 'bytes': size, 'mean_seconds': seconds / calls if calls else 0.0}
+            for stage, (calls, seconds, size) in sorted(stages.items())}
+
+
+def merge(stages):
+    """Adds the stages of a `summary()` taken elsewhere, e.g. in a worker process."""
+    for stage, values in stages.items():
+        record(stage, values['seconds'], values['bytes'], values['calls'])
+
+
+def format_summary(stages=None):
+    """Renders a summary as a text table, slowest stage first."""
+    stages = summary() if stages is None else stages
+    lines = [f"{'stage':28} {'calls':>8} {'total ms':>12} {'mean ms':>10} {'MB':>10}"]
+    for stage, values in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+        lines.append(f"{stage:28} {values['calls']:8d} {values['seconds'] * 1000:12.2f} "
+                     f"{values['mean_seconds'] * 1000:10.3f} {values['bytes'] / 1e6:10.2f}")
+    return '\n'.join(lines) + '\n'
+
+
+def to_prometheus(stages=None):
+    """Renders a summary in the Prometheus text exposition format, as counters labelled by stage."""
+    stages = summary() if stages is None else stages
+    lines = []
+    for metric, key, description in (('calls_total', 'calls', 'Calls of each instrumented stage.'),
+                                     ('seconds_total', 'seconds', 'Wall time spent in each instrumented stage.'),
+                                     ('bytes_total', 'bytes', 'Bytes processed by each instrumented stage.')):
+        name = f'{METRIC_PREFIX}_{metric}'
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for stage, values in stages.items():
+            lines.append(f'{name}{{stage="{stage}"}} {values[key]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,418 @@
+"""
+Link checker for course directories.
+
+Usage:
+    python linkcheck.py "test files/cs263-Public" [--no-external] [--cache ./linkcache.json] [--ttl 86400]
+                        [--concurrency 20] [--timeout 10]
+
+Internal links are resolved against the directory tree, relative to the file they appear in (or
+to the checked directory for links starting with '/'), and their anchors against the slugs of the
+target's headings. External links are deduplicated across the whole directory and checked
+concurrently with asyncio, over keep-alive connections pooled per host. Their results are kept in
+a persistent cache for `--ttl` seconds, so repeated runs only fetch the URLs that expired.
+
+The HTTP layer is the `fetcher` of a LinkChecker: any object with an `async fetch(url)` method
+returning (status code or None, error message or None), e.g. to point the checker at a stub server.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urljoin, urlsplit
+from analysis import read_markdown, split_sections
+from batch import find_files
+
+# Result of one link of one file. kind is 'internal', 'anchor', 'external' or 'skipped'
+LinkResult = namedtuple('LinkResult', 'source link kind ok detail')
+
+# Schemes of links that are neither files nor fetched over HTTP
+SKIPPED_SCHEMES = ('mailto:', 'tel:', 'ftp:', 'javascript:', 'data:')
+
+# Statuses after which a HEAD request is retried as GET, some servers do not implement HEAD
+HEAD_NOT_SUPPORTED = (403, 405, 501)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Explicit anchors in raw HTML, e.g. <a name="setup"> or <div id="setup">
+_html_anchor = re.compile(r'''<[^>]*\b(?:id|name)\s*=\s*["']([^"']+)["']''')
+
+
+def link_target(link):
+    """Returns the target of a Markdown link, without its optional title and angle brackets."""
+    link = link.strip()
+    if link.startswith('<') and '>' in link:
+        return link[1:link.index('>')]
+    return link.split()[0] if link else link
+
+
+def heading_slug(heading):
+    """Returns the anchor GitHub generates for a heading: lowercase, punctuation removed, spaces as dashes."""
+    slug = re.sub(r'[^\w\- ]', '', heading.strip().lower())
+    return slug.replace(' ', '-')
+
+
+def heading_slugs(headings):
+    """Returns the anchors of a list of headings, numbering repeated ones like GitHub does (setup, setup-1, ...)."""
+    slugs = set()
+    seen = {}
+    for heading in headings:
+        slug = heading_slug(heading)
+        if slug in seen:
+            seen[slug] += 1
+            slug = f"{slug}-{seen[slug]}"
+        else:
+            seen[slug] = 0
+        slugs.add(slug)
+    return slugs
+
+
+class LinkCache:
+    """
+    Persistent cache of the results of external links, kept in a JSON file.
+
+    Working links are trusted for `ttl` seconds, broken ones for `failure_ttl` seconds, so a link
+    that was down for a moment is checked again sooner.
+    """
+
+    def __init__(self, path='./linkcache.json', ttl=86400, failure_ttl=3600):
+        """
+        Initializes an instance of the LinkCache class and reads the cache file if it exists.
+
+        Args:
+            path (str): The cache file.
+            ttl (float): Seconds a working link is trusted.
+            failure_ttl (float): Seconds a broken link is trusted.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {} # url -> [checked at, status, error]
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+
+    def get(self, url, now=None):
+        """Returns the cached (status, error) of a URL, or None if it was never checked or expired."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            checked_at, status, error = entry
+            ttl = self.ttl if is_ok(status) else self.failure_ttl
+            if (now or time.time()) - checked_at < ttl:
+                self.hits += 1
+                return status, error
+        self.misses += 1
+        return None
+
+    def put(self, url, status, error, now=None):
+        self._entries[url] = [now or time.time(), status, error]
+
+    def save(self):
+        """Writes the unexpired entries to the cache file, atomically."""
+        if not self.path:
+            return
+        now = time.time()
+        entries = {url: entry for url, entry in self._entries.items()
+                   if now - entry[0] < max(self.ttl, self.failure_ttl)}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+def is_ok(status):
+    return status is not None and status < 400
+
+
+class HTTPFetcher:
+    """
+    Checks URLs with HEAD requests (GET when HEAD is refused) on keep-alive connections pooled per host.
+
+    Requests run on a thread pool so asyncio can wait on many of them at once, and at most
+    `per_host` of them go to the same host at a time.
+    """
+    user_agent = 'course-companion-linkcheck'
+
+    def __init__(self, timeout=10, max_connections=20, per_host=4, max_redirects=5):
+        """
+        Initializes an instance of the HTTPFetcher class.
+
+        Args:
+            timeout (float): Seconds to wait for a host to connect or answer.
+            max_connections (int): Requests running at the same time.
+            per_host (int): Requests running at the same time on one host.
+            max_redirects (int): Redirects followed before a link is reported broken.
+        """
+        self.timeout = timeout
+        self.per_host = per_host
+        self.max_redirects = max_redirects
+        self._executor = ThreadPoolExecutor(max_connections)
+        self._idle = {} # (scheme, host) -> idle connections to reuse
+        self._idle_lock = threading.Lock()
+        self._host_limits = {} # host -> asyncio.Semaphore of the running event loop
+        self._loop = None # Event loop the semaphores belong to
+
+    async def fetch(self, url):
+        """Returns the final (status, error) of a URL after following redirects."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Every asyncio.run has a new loop, and a semaphore cannot be shared across loops
+            self._host_limits = {}
+            self._loop = loop
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        async with limit:
+            return await loop.run_in_executor(self._executor, self._check, url)
+
+    def _connection(self, key):
+        """Returns an idle connection to a host, or a new one, and whether it is reused."""
+        with self._idle_lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, timeout=self.timeout), False
+
+    def _release(self, key, connection):
+        with self._idle_lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _request(self, key, method, path):
+        """Sends one request, retrying once on a fresh connection if a reused one was closed by the host."""
+        while True:
+            connection, reused = self._connection(key)
+            try:
+                connection.request(method, path, headers={'User-Agent': self.user_agent})
+                response = connection.getresponse()
+                status, location = response.status, response.getheader('Location')
+                if method == 'HEAD':
+                    response.read()
+                    self._release(key, connection)
+                else:
+                    connection.close() # Never download the body of a page just to check it
+                return status, location
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if not reused:
+                    raise
+
+    def _check(self, url):
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                return None, f"unsupported scheme {parts.scheme}"
+            key = (parts.scheme, parts.netloc)
+            path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+            try:
+                status, location = self._request(key, 'HEAD', path)
+                if status in HEAD_NOT_SUPPORTED:
+                    status, location = self._request(key, 'GET', path)
+            except (OSError, http.client.HTTPException) as error:
+                return None, str(error) or type(error).__name__
+            if status in REDIRECT_STATUSES and location:
+                url = urljoin(url, location)
+                continue
+            return status, None
+        return None, "too many redirects"
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        with self._idle_lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+class LinkChecker:
+    """
+    Checks the links of the files of a course directory.
+
+    Attributes:
+        root (str): The checked directory.
+        fetcher: Object whose `async fetch(url)` returns (status, error), None to skip external links.
+        cache (LinkCache): Results of external links from previous runs.
+    """
+
+    def __init__(self, root, fetcher=None, cache=None, concurrency=20):
+        """
+        Initializes an instance of the LinkChecker class.
+
+        Args:
+            root (str): The directory to check.
+            fetcher: Object whose `async fetch(url)` returns (status, error), None to skip external links.
+            cache (LinkCache): Results of external links from previous runs, None to fetch every URL.
+            concurrency (int): External links checked at the same time.
+        """
+        self.root = root
+        self.fetcher = fetcher
+        self.cache = cache
+        self.concurrency = concurrency
+        self._anchors = {} # path -> anchors of the file, read once per file
+
+    def links(self, paths):
+        """Returns the (source path, link) of every link of the given files, in document order."""
+        links = []
+        for path in paths:
+            try:
+                markdown_input = read_markdown(path)
+            except (ValueError, OSError, UnicodeDecodeError):
+                continue
+            if markdown_input is None:
+                continue
+            sections, _ = split_sections(markdown_input)
+            for section in sections:
+                metrics = section.metrics
+                links.extend((path, link) for link in metrics.internal_links + metrics.external_links)
+        return links
+
+    def anchors(self, path):
+        """Returns the anchors of a Markdown file, lowercase: its heading slugs and explicit HTML ids and names."""
+        anchors = self._anchors.get(path)
+        if anchors is None:
+            try:
+                markdown_input = read_markdown(path)
+            except (ValueError, OSError, UnicodeDecodeError):
+                markdown_input = None
+            anchors = set()
+            if markdown_input:
+                sections, _ = split_sections(markdown_input)
+                anchors = heading_slugs(section.heading for section in sections)
+                # Fragments are compared lowercase like the slugs, so <a id="Setup"> matches #setup and #Setup
+                anchors.update(anchor.lower() for anchor in _html_anchor.findall(''.join(markdown_input)))
+            self._anchors[path] = anchors
+        return anchors
+
+    def check_internal(self, source, link):
+        """Resolves a link that is not fetched over HTTP."""
+        target = link_target(link)
+        if target.lower().startswith(SKIPPED_SCHEMES):
+            return LinkResult(source, link, 'skipped', True, None)
+        parts = urlsplit(target)
+        if parts.scheme or parts.netloc:
+            return LinkResult(source, link, 'skipped', True, f"not checked: {parts.scheme or parts.netloc}")
+
+        if not parts.path:
+            target_path = source # Anchor in the same file
+        elif parts.path.startswith('/'):
+            target_path = os.path.join(self.root, unquote(parts.path).lstrip('/'))
+        else:
+            target_path = os.path.join(os.path.dirname(source), unquote(parts.path))
+        target_path = os.path.normpath(target_path)
+        if not os.path.exists(target_path):
+            return LinkResult(source, link, 'internal', False, f"{target_path} does not exist")
+
+        if parts.fragment and target_path.endswith('.md'):
+            anchor = unquote(parts.fragment).lower()
+            if anchor not in self.anchors(target_path):
+                return LinkResult(source, link, 'anchor', False, f"no heading #{parts.fragment} in {target_path}")
+            return LinkResult(source, link, 'anchor', True, None)
+        return LinkResult(source, link, 'internal', True, None)
+
+    async def check_urls(self, urls):
+        """
+        Checks distinct URLs concurrently, reading and filling the cache.
+
+        Returns:
+            dict: url -> (status, error).
+        """
+        results = {}
+        missing = []
+        for url in urls:
+            cached = self.cache.get(url) if self.cache is not None else None
+            if cached is None:
+                missing.append(url)
+            else:
+                results[url] = cached
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def check(url):
+            async with limit:
+                results[url] = await self.fetcher.fetch(url)
+            if self.cache is not None:
+                self.cache.put(url, *results[url])
+
+        await asyncio.gather(*(check(url) for url in missing))
+        return results
+
+    def check(self, paths=None):
+        """
+        Checks every link of the given files, of every supported file below the root by default.
+
+        Returns:
+            list: The LinkResult of every link, in file and document order.
+        """
+        links = self.links(find_files(self.root) if paths is None else paths)
+        results = [None] * len(links)
+        external = {} # URL without its fragment -> indices of the links pointing to it
+        for i, (source, link) in enumerate(links):
+            target = link_target(link)
+            if target.startswith(('http://', 'https://')):
+                if self.fetcher is None:
+                    results[i] = LinkResult(source, link, 'skipped', True, "external links not checked")
+                else:
+                    external.setdefault(target.split('#', 1)[0], []).append(i)
+            else:
+                results[i] = self.check_internal(source, link)
+
+        if external:
+            statuses = asyncio.run(self.check_urls(list(external)))
+            for url, indices in external.items():
+                status, error = statuses[url]
+                detail = error if error else (None if is_ok(status) else f"HTTP {status}")
+                for i in indices:
+                    source, link = links[i]
+                    results[i] = LinkResult(source, link, 'external', is_ok(status), detail)
+            if self.cache is not None:
+                self.cache.save()
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the internal and external links of a course directory.")
+    parser.add_argument('directory', help="directory tree to check")
+    parser.add_argument('--no-external', action='store_true', help="only check links to files and headings")
+    parser.add_argument('--cache', default='./linkcache.json', help="file the external link results are kept in")
+    parser.add_argument('--ttl', type=float, default=86400, help="seconds a working external link is trusted")
+    parser.add_argument('--concurrency', type=int, default=20, help="external links checked at the same time")
+    parser.add_argument('--timeout', type=float, default=10, help="seconds to wait for a host")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    fetcher = None if args.no_external else HTTPFetcher(args.timeout, args.concurrency)
+    cache = None if args.no_external else LinkCache(args.cache, args.ttl)
+    checker = LinkChecker(args.directory, fetcher, cache, args.concurrency)
+    start = time.perf_counter()
+    try:
+        results = checker.check()
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+    elapsed = time.perf_counter() - start
+
+    broken = [result for result in results if not result.ok]
+    for result in broken:
+        print(f"{result.source}: {result.link} ({result.detail})")
+    external = {link_target(result.link).split('#', 1)[0] for result in results if result.kind == 'external'}
+    print(f"{len(results)} links checked in {elapsed:.2f} s, {len(broken)} broken, "
+          f"{len(external)} distinct external URLs", end='')
+    print(f", {cache.hits} from the cache" if cache is not None else "")
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Markdown frontend: finds the headings of a document and tokenizes the content of its sections.
+
+`iter_blocks` reads a document line by line and tells headings from content. It knows fenced code
+blocks, so a `#include` line inside a code block is not a heading, and setext headings (a line
+underlined with === or ---). Raw TeX command lines such as `\\bSidebar` are dropped, while escaped
+Markdown such as `\\*not italic\\*` is kept as content.
+
+`tokenize` turns the content of a section into the tokens every metric is read from: code blocks,
+headings, block quote and list item lines, code spans, bold and italic spans, links and sentence
+ends. Emphasis follows the CommonMark delimiter rules, so `***both***` is one bold and one italic
+span and `**bold**` is not also counted as italics. Code blocks and code spans are opaque, nothing
+inside them counts as emphasis, links or sentences.
+
+Both run in linear time: every line is classified once, and the inline pass moves forward through
+each paragraph once, pairing emphasis delimiters on a linked stack.
+"""
+import re
+import unicodedata
+from collections import namedtuple
+from instrumentation import instrument
+
+# One token of a section: its kind, its span in the section content and its value
+Token = namedtuple('Token', 'kind start end value')
+
+# Kinds of the tokens produced by `tokenize`
+KINDS = ('code_block', 'header', 'quote', 'list_item', 'inline_code', 'bold', 'italic', 'link', 'sentence')
+
+# Block patterns, matched at the start of a line. Fences may be indented or inside block quotes, and a
+# backtick fence's info string cannot contain backticks
+_fence_open = re.compile(r'[ \t]*(?:>[ \t]*)*(`{3,}(?=[^`]*$)|~{3,})')
+_fence_close = re.compile(r'[ \t]*(?:>[ \t]*)*(`{3,}|~{3,})[ \t]*$')
+_atx = re.compile(r' {0,3}(#{1,6})(?:[ \t]|$)')
+_atx_closing = re.compile(r'(?:^|[ \t]+)#+[ \t]*$')
+_setext = re.compile(r' {0,3}(=+|-+)[ \t]*$')
+
+# All the block patterns in one, so a line is classified by a single match. The order matters,
+# e.g. `- - -` and `* * *` are thematic breaks before they are list items, as in CommonMark. Plain
+# paragraph lines match nothing
+_thematic_break = r'\ {0,3}(?P<rule>[-*_])(?:[ \t]*(?P=rule)){2,}[ \t]*$'
+_block = re.compile(r'''
+    (?P<blank>\s*$)
+  | (?P<fence>[ \t]*(?:>[ \t]*)*(?:`{3,}(?=[^`]*$)|~{3,}))
+  | (?P<atx>\ {0,3}\#{1,6}(?:[ \t]|$))
+  | (?P<tex>\\[A-Za-z])
+  | (?P<thematic_break>''' + _thematic_break + r''')
+  | (?P<container>>+\s|[^\S\n]*(?:\*|\+|-|\d+\.)[^\S\n]+)
+  | (?P<underline>\ {0,3}(?:=+|-+)[ \t]*$)
+''', re.VERBOSE)
+
+# The same patterns over a whole section, so a section is tokenized by one scan of the lines starting
+# a construct instead of a Python loop over every line. A fence may be quoted too, see `tokenize`
+_special_lines = re.compile(r'''^(?:
+    (?P<fence>[ \t]*(?:>[ \t]*)*(`{3,}|~{3,})(.*))
+  | \ {0,3}(?P<header>\#{1,6}(?:[ \t].*)?)$
+  | (?P<quote>>+(?:[^\S\n].*|(?=\n)))
+  | (?!''' + _thematic_break + r''')(?P<list_item>[^\S\n]*(?:\*|\+|-|\d+\.)[^\S\n]+)
+)''', re.MULTILINE | re.VERBOSE)
+_quote_line = re.compile(r'>+(?:[^\S\n].*|(?=\n))')
+_paragraphs = re.compile(r'^(?:[ \t]*\S.*(?:\n|$))+', re.MULTILINE)
+
+# Inline pattern, one alternative per construct: escape, backtick run, emphasis delimiter run,
+# link text opener, link text closer followed by a destination, other bracket closer, sentence end.
+# Every alternative starts with a literal character so the engine skips plain text by character set,
+# the construct is told by that first character
+_inline = re.compile(r'\\[!-/:-@\[-`{-~]|``*|\*\**|__*|!\[|\[|\]\(|\]|\.(?=\s|$)|!(?=\s|$)|\?(?=\s|$)')
+_backticks = re.compile(r'`+')
+
+
+def heading_text(line, start):
+    """Returns the text of an ATX heading line, without its optional closing #s."""
+    return _atx_closing.sub('', line[start:].strip())
+
+
+def iter_blocks(lines):
+    """
+    Classifies the lines of a Markdown document.
+
+    Lines that may be the text of a setext heading are held back until the next line shows what
+    they are, so memory is bounded by the longest paragraph.
+
+    Args:
+        lines (iterable): The Markdown lines of the document, with their line endings.
+
+    Yields:
+        tuple: (heading level, heading text) for every heading, and (0, line) for every content line.
+    """
+    fence = None # Marker of the open code fence
+    paragraph = [] # Lines of the open paragraph, a setext underline turns them into a heading
+    in_container = False # After a list item or quote line, the following lines continue it until a blank line
+
+    for line in lines:
+        if fence is not None:
+            match = _fence_close.match(line)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+                fence = None
+            yield 0, line
+            continue
+
+        block = _block.match(line)
+        kind = block.lastgroup if block else None
+        if paragraph and kind in ('thematic_break', 'underline'):
+            match = _setext.match(line)
+            if match:
+                yield (1 if match.group(1)[0] == '=' else 2), ' '.join(text.strip() for text in paragraph)
+                paragraph = []
+                continue
+
+        if kind is None or kind == 'underline':
+            if paragraph or not in_container:
+                paragraph.append(line)
+            else:
+                yield 0, line
+            continue
+
+        # Any other line closes the open paragraph
+        for text in paragraph:
+            yield 0, text
+        paragraph = []
+
+        if kind == 'blank':
+            in_container = False
+            yield 0, line
+        elif kind == 'fence':
+            fence = _fence_open.match(line).group(1)
+            yield 0, line
+        elif kind == 'atx':
+            match = _atx.match(line)
+            in_container = False
+            yield len(match.group(1)), heading_text(line, match.end())
+        elif kind != 'tex':
+            # Raw TeX lines are dropped
+            in_container = kind == 'container'
+            yield 0, line
+
+    for text in paragraph:
+        yield 0, text
+
+
+@instrument('tokenize', size=lambda tokens, text: len(text))
+def tokenize(text):
+    """
+    Tokenizes the content of a section.
+
+    Args:
+        text (str): The section content.
+
+    Returns:
+        dict: kind -> list of the Tokens of that kind, in text order, for every kind of KINDS.
+    """
+    tokens = {kind: [] for kind in KINDS}
+    length = len(text)
+
+    # One pass over the lines starting a construct finds the code blocks, and the headings, quotes
+    # and list items outside of them
+    prose = [] # (start, end) of the text outside code blocks
+    prose_start = 0
+    fence = None # Match of the open code fence
+    for match in _special_lines.finditer(text):
+        kind = match.lastgroup
+        if kind == 'fence':
+            marker, rest = match.group(2), match.group(3)
+            if fence is None:
+                if marker[0] == '~' or '`' not in rest:
+                    prose.append((prose_start, match.start()))
+                    fence = match
+            elif marker[0] == fence.group(2)[0] and len(marker) >= len(fence.group(2)) and not rest.strip(' \t'):
+                tokens['code_block'].append(Token('code_block', fence.start(2), match.end(2),
+                                                  text[fence.end(2):match.start(2)]))
+                fence = None
+                prose_start = text.find('\n', match.end())
+                prose_start = length if prose_start == -1 else prose_start + 1
+            if text[match.start()] == '>':
+                # The lines of a code block inside a block quote are still quoted
+                quote = _quote_line.match(text, match.start())
+                if quote:
+                    tokens['quote'].append(Token('quote', quote.start(), quote.end(), quote.group()))
+        elif kind == 'quote':
+            tokens['quote'].append(Token('quote', match.start(), match.end(), match.group()))
+        elif fence is None:
+            tokens[kind].append(Token(kind, match.start(kind), match.end(kind), match.group(kind)))
+    if fence is not None:
+        # An unclosed fence runs to the end of the section
+        tokens['code_block'].append(Token('code_block', fence.start(2), length, text[fence.end(2):]))
+    else:
+        prose.append((prose_start, length))
+
+    for start, end in prose:
+        for paragraph in _paragraphs.finditer(text, start, end):
+            _tokenize_inline(text, paragraph.start(), paragraph.end(), tokens)
+    tokens['bold'].sort(key=lambda token: token.start)
+    tokens['italic'].sort(key=lambda token: token.start)
+    return tokens
+
+
+def _is_punctuation(char):
+    return unicodedata.category(char)[0] in 'PS'
+
+
+def _tokenize_inline(text, start, end, tokens):
+    """Adds the inline tokens of one paragraph, text[start:end], to tokens."""
+    delimiters = [] # [char, position, run length, remaining length, can open, can close] of every emphasis delimiter run
+    brackets = [] # Positions of the [ not closed yet
+    no_closer = {} # Backtick run length -> position from which no run of that length is left
+    unclosed_lines = {} # Line end -> closing ) of every destination start on the line, see _destination_end
+    pos = start
+    while True:
+        match = _inline.search(text, pos, end)
+        if match is None:
+            break
+        char = text[match.start()]
+        pos = match.end()
+
+        if char == '`':
+            # Code span: closed by the next backtick run of the same length, its content is not parsed
+            run = pos - match.start()
+            closer = None
+            if no_closer.get(run, end) > pos:
+                for candidate in _backticks.finditer(text, pos, end):
+                    if candidate.end() - candidate.start() == run:
+                        closer = candidate
+                        break
+                if closer is None:
+                    no_closer[run] = pos
+            if closer is not None:
+                tokens['inline_code'].append(Token('inline_code', match.start(), closer.end(), text[pos:closer.start()]))
+                pos = closer.end()
+        elif char == '*' or char == '_':
+            before = text[match.start() - 1] if match.start() > start else ' '
+            after = text[pos] if pos < end else ' '
+            left_flanking = not after.isspace() and (not _is_punctuation(after) or before.isspace() or _is_punctuation(before))
+            right_flanking = not before.isspace() and (not _is_punctuation(before) or after.isspace() or _is_punctuation(after))
+            if char == '*':
+                can_open, can_close = left_flanking, right_flanking
+            else:
+                # Underscores do not open or close inside words, e.g. snake_case_names
+                can_open = left_flanking and (not right_flanking or _is_punctuation(before))
+                can_close = right_flanking and (not left_flanking or _is_punctuation(after))
+            if can_open or can_close:
+                run = pos - match.start()
+                delimiters.append([char, match.start(), run, run, can_open, can_close])
+        elif char == '[' or pos - match.start() == 2 and char == '!':
+            brackets.append(pos - 1)
+        elif char == ']':
+            if brackets:
+                opener = brackets.pop()
+                if pos - match.start() == 2:
+                    close = _destination_end(text, pos, end, unclosed_lines)
+                    if close is not None:
+                        tokens['link'].append(Token('link', opener, close + 1, text[pos:close]))
+                        pos = close + 1
+        elif char != '\\':
+            tokens['sentence'].append(Token('sentence', match.start(), pos, char))
+        # A backslash escapes a character, which is plain text
+
+    if delimiters:
+        _pair_emphasis(text, delimiters, tokens)
+
+
+def _destination_end(text, pos, end, unclosed_lines):
+    """
+    Returns the position of the ) closing a link destination starting at pos, None if it is not closed on its line.
+
+    A closed destination is skipped by the inline pass, so scanning to its ) is paid once. A line where
+    a destination is not closed, e.g. `[a](` repeated, would be scanned again for every later `](`, so
+    the first failed scan builds the answer of every position of the rest of the line in one pass and
+    stores it in unclosed_lines, keyed by the line end.
+    """
+    line_end = text.find('\n', pos, end)
+    if line_end == -1:
+        line_end = end
+    if pos >= line_end:
+        return None
+    table = unclosed_lines.get(line_end)
+    if table is not None:
+        start, closes = table
+        return closes[pos - start]
+
+    depth = 0
+    i = pos
+    while i < line_end:
+        char = text[i]
+        if char == '\\':
+            i += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                return i
+            depth -= 1
+        i += 1
+    unclosed_lines[line_end] = pos, _closing_parentheses(text, pos, line_end)
+    return None
+
+
+def _closing_parentheses(text, start, stop):
+    """
+    Returns, for every position of text[start:stop] in order, the ) a destination starting there would
+    close on, or None.
+
+    From right to left, the closes not yet matched by a ( are kept on a stack, so the top of the stack is
+    the first ) left unmatched by the text following a position.
+    """
+    escaped = [False] * (stop - start)
+    i = start
+    while i < stop:
+        if text[i] == '\\' and i + 1 < stop:
+            escaped[i + 1 - start] = True
+            i += 1
+        i += 1
+
+    closes = [None] * (stop - start)
+    pending = [] # Positions of the ) not matched by a ( from the current position on
+    for i in range(stop - 1, start - 1, -1):
+        char = text[i]
+        if not escaped[i - start]:
+            if char == ')':
+                pending.append(i)
+            elif char == '(' and pending:
+                pending.pop()
+        closes[i - start] = pending[-1] if pending else None
+    return closes
+
+
+def _pair_emphasis(text, delimiters, tokens):
+    """
+    Pairs emphasis delimiter runs into bold and italic tokens, following the CommonMark algorithm.
+
+    Delimiters form a doubly linked list, pairing a closer with its opener unlinks everything between
+    them, and the lowest opener searched for each kind of closer only goes up, so the pass is linear.
+    """
+    count = len(delimiters)
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    openers_bottom = {} # (char, closer can open, run length % 3) -> index below which no opener matches
+
+    def unlink(index):
+        before, after = previous[index], following[index]
+        if before >= 0:
+            following[before] = after
+        if after < count:
+            previous[after] = before
+
+    closer = 0
+    while closer < count:
+        close = delimiters[closer]
+        if not close[5]:
+            closer = following[closer]
+            continue
+        key = (close[0], close[4], close[2] % 3)
+        bottom = openers_bottom.get(key, -1)
+        opener = previous[closer]
+        while opener > bottom:
+            open_ = delimiters[opener]
+            # A run that can both open and close cannot pair with one making their sum a multiple of 3
+            if open_[0] == close[0] and open_[4] and not (
+                    (open_[5] or close[4]) and (open_[2] + close[2]) % 3 == 0 and (open_[2] % 3 or close[2] % 3)):
+                break
+            opener = previous[opener]
+        else:
+            openers_bottom[key] = previous[closer]
+            after = following[closer]
+            if not close[4]:
+                unlink(closer)
+            closer = after
+            continue
+
+        used = 2 if open_[3] >= 2 and close[3] >= 2 else 1
+        open_end = open_[1] + open_[3]
+        close_start = close[1] + close[2] - close[3]
+        kind = 'bold' if used == 2 else 'italic'
+        tokens[kind].append(Token(kind, open_end - used, close_start + used, text[open_end:close_start]))
+
+        # Delimiters between the opener and the closer can no longer pair
+        following[opener] = closer
+        previous[closer] = opener
+        open_[3] -= used
+        close[3] -= used
+        if open_[3] == 0:
+            unlink(opener)
+        if close[3] == 0:
+            after = following[closer]
+            unlink(closer)
+            closer = after
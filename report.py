@@ -0,0 +1,285 @@
+"""
+Structured analysis report and its text, JSON and CSV renderers.
+
+A `DocumentReport` holds the document totals and alerts and one `SectionResult` per section. Every
+output format is rendered from these records in a single pass that collects the pieces of the
+output in a list and joins them once.
+
+A `ReportFile` reads a text report saved earlier by memory-mapping it. Both classes expose the same
+report source interface (`header_text`, `headings`, `section_text` and `to_text`) so a viewer can
+render the heading tree up front and each section only when it is shown.
+"""
+import csv
+import io
+import json
+import mmap
+import re
+from instrumentation import instrument
+
+# Ratio of bold or italic words to all words above which a section or document is flagged (arbitrary ratio set)
+EMPHASIS_ALERT_RATIO = 0.08
+
+# Alert codes, as stored in the report, and the message shown for each in the text report
+SECTION_ALERTS = {
+    'too_many_links': "There are too many hyperlinks in your input document, considering removing some.",
+    'too_many_italics': "There are too many italicized words in this section.",
+    'too_many_bold': "There are too many bolded words in this section.",
+}
+DOCUMENT_ALERTS = {
+    'too_many_italics': "There are too many italicized words in this document.",
+    'too_many_bold': "There are too many bolded words in this document.",
+}
+
+# Columns of the CSV export, one row per section with the document columns repeated
+CSV_COLUMNS = ('file_name', 'content_hash', 'heading', 'heading_level', 'words', 'bold', 'italics',
+               'sentences', 'paragraphs', 'inline_code', 'block_quotes', 'internal_links', 'external_links',
+               'lists', 'code_blocks', 'code_languages', 'alerts')
+
+
+def emphasis_alerts(words, italics, bold):
+    """Returns the alert codes raised by too many italicized or bolded words."""
+    alerts = []
+    if words > 0:
+        if italics/words > EMPHASIS_ALERT_RATIO:
+            alerts.append('too_many_italics')
+        if bold/words > EMPHASIS_ALERT_RATIO:
+            alerts.append('too_many_bold')
+    return alerts
+
+
+def section_alerts(metrics):
+    """Returns the alert codes raised on the metrics of one section."""
+    alerts = []
+    # Flag to user if there are more hyperlinks than words in section
+    if len(metrics.internal_links) + len(metrics.external_links) > metrics.words:
+        alerts.append('too_many_links')
+    return alerts + emphasis_alerts(metrics.words, metrics.italics, metrics.bold)
+
+
+class SectionResult:
+    """
+    Analysis result of one Markdown section.
+    """
+    __slots__ = ('heading', 'heading_level', 'words', 'bold', 'sentences', 'paragraphs', 'italics',
+                 'inline_code', 'block_quotes', 'internal_links', 'external_links', 'list_lengths',
+                 'code_blocks', 'code_languages', 'alerts')
+
+    def __init__(self, heading, heading_level, metrics):
+        """
+        Initializes an instance of the SectionResult class and raises its alerts.
+
+        Args:
+            heading (str): The heading/title of the section.
+            heading_level (int): The level of the heading.
+            metrics (SectionMetrics): The metrics of the section content.
+        """
+        self.heading = heading
+        self.heading_level = heading_level
+        self.words = metrics.words
+        self.bold = metrics.bold
+        self.sentences = metrics.sentences
+        self.paragraphs = metrics.paragraphs
+        self.italics = metrics.italics
+        self.inline_code = metrics.inline_code
+        self.block_quotes = metrics.block_quotes
+        self.internal_links = metrics.internal_links
+        self.external_links = metrics.external_links
+        self.list_lengths = metrics.list_lengths
+        self.code_blocks = len(metrics.code_blocks)
+        self.code_languages = metrics.code_languages
+
+        self.alerts = section_alerts(metrics)
+
+    @classmethod
+    def from_section(cls, section):
+        """Returns the result of a MarkdownSection."""
+        return cls(section.heading, section.heading_level, section.metrics)
+
+    def text_parts(self):
+        """Returns the pieces of the text report of the section, to be joined by the caller."""
+        tab = '    ' * (self.heading_level - 1)  # This adds an indent for each level subsection
+        parts = [f"{tab}Heading Level {self.heading_level} Title: {self.heading}\n"]
+        for label, value in (("Words", self.words), ("Bold Words", self.bold), ("Sentences", self.sentences),
+                             ("Paragraphs", self.paragraphs), ("Italics", self.italics),
+                             ("Inline Code Blocks", self.inline_code), ("Block Quotes", self.block_quotes)):
+            if value > 0:
+                parts.append(f"{tab}* {label}: {value}\n")
+        if self.internal_links:
+            parts.append(f"{tab}* Internal Links: {self.internal_links}\n")
+        if self.external_links:
+            parts.append(f"{tab}* External Links: {self.external_links}\n")
+        if self.list_lengths:
+            parts.append(f"{tab}* Lists: {len(self.list_lengths)}\n")
+        # adding individual list length
+        parts.extend(f"{tab}   - Length of List {i}: {length}\n" for i, length in enumerate(self.list_lengths, start=1))
+        if self.code_blocks > 0:
+            parts.append(f"{tab}* Code Blocks: {self.code_blocks}\n")
+        # adding code block languages
+        parts.extend(f"{tab}   - Code Block {i}: Language - {language.capitalize()}\n"
+                     for i, language in enumerate(self.code_languages, start=1))
+        parts.extend(f"{tab}* {SECTION_ALERTS[alert]}\n" for alert in self.alerts)
+        return parts
+
+    def to_text(self):
+        """Renders the text report of the section."""
+        return ''.join(self.text_parts())
+
+    def to_dict(self):
+        """Returns the result as a JSON-serializable dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class DocumentReport:
+    """
+    Analysis report of a whole document: its totals, alerts and section results.
+    """
+    __slots__ = ('file_name', 'content_hash', 'headers', 'words', 'bold', 'italics',
+                 'heading_level_count', 'alerts', 'sections')
+
+    def __init__(self, file_name, totals, heading_level_count, sections, content_hash=None):
+        """
+        Initializes an instance of the DocumentReport class and raises its alerts.
+
+        Args:
+            file_name (str): Name of the analyzed file.
+            totals (dict): The document totals, keyed 'words', 'bold', 'italics' and 'headers'.
+            heading_level_count (list): The number of headers at each level 1-7.
+            sections (list): The SectionResult of every section, in document order.
+            content_hash (str): SHA-256 of the analyzed file, if known.
+        """
+        self.file_name = file_name
+        self.content_hash = content_hash
+        self.headers = totals['headers']
+        self.words = totals['words']
+        self.bold = totals['bold']
+        self.italics = totals['italics']
+        self.heading_level_count = heading_level_count
+        self.alerts = emphasis_alerts(self.words, self.italics, self.bold)
+        self.sections = sections
+
+    def header_parts(self):
+        """Returns the pieces of the top of the text report: file name, totals and alerts."""
+        parts = [
+            f"Input File Name: {self.file_name}\n\n",
+            f"Total Number of Headers: {self.headers}\n\n",
+            f"Total Number of Words: {self.words}\n\n",
+            f"Total Bold Count: {self.bold}\n",
+            f"Total Italic Count: {self.italics}\n\n",
+        ]
+        parts.extend(f'Total Level {i+1} Headers : {count}\n' for i, count in enumerate(self.heading_level_count) if count != 0)
+        parts.append('\n')
+        parts.extend(f"**ALERT** {DOCUMENT_ALERTS[alert]}\n" for alert in self.alerts)
+        if self.alerts:
+            parts.append('\n')
+        parts.append("-------------------------------\n\n")
+        return parts
+
+    @instrument('report.text', size=lambda text, self: len(text))
+    def to_text(self):
+        """Renders the text report of the document."""
+        parts = self.header_parts()
+        for i, section in enumerate(self.sections):
+            if i:
+                parts.append('\n\n')  # Add a newline between sections
+            parts.extend(section.text_parts())
+        return ''.join(parts)
+
+    def header_text(self):
+        """Renders the top of the text report."""
+        return ''.join(self.header_parts())
+
+    def headings(self):
+        """Returns the (heading level, heading) of every section, in document order."""
+        return [(section.heading_level, section.heading) for section in self.sections]
+
+    def section_text(self, index):
+        """Renders the text report of one section."""
+        return self.sections[index].to_text()
+
+    def to_dict(self):
+        """Returns the report as a JSON-serializable dict."""
+        values = {name: getattr(self, name) for name in self.__slots__ if name != 'sections'}
+        values['sections'] = [section.to_dict() for section in self.sections]
+        return values
+
+    @instrument('report.json', size=lambda text, self: len(text))
+    def to_json(self):
+        """Renders the report as one line of JSON, e.g. for a JSON Lines export."""
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def csv_rows(self):
+        """Returns one CSV row per section, in the order of CSV_COLUMNS."""
+        return [
+            (self.file_name, self.content_hash, section.heading, section.heading_level, section.words,
+             section.bold, section.italics, section.sentences, section.paragraphs, section.inline_code,
+             section.block_quotes, len(section.internal_links), len(section.external_links),
+             len(section.list_lengths), section.code_blocks, '; '.join(section.code_languages),
+             '; '.join(section.alerts))
+            for section in self.sections
+        ]
+
+    @instrument('report.csv', size=lambda text, self, *args, **kwargs: len(text))
+    def to_csv(self, header=True):
+        """Renders the sections of the report as CSV, with a header row unless header is False."""
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if header:
+            writer.writerow(CSV_COLUMNS)
+        writer.writerows(self.csv_rows())
+        return out.getvalue()
+
+
+class ReportFile:
+    """
+    Text report saved earlier, memory-mapped so only the parts that are shown are read and decoded.
+
+    Opening the file finds the offset of every section with one regular expression pass over the
+    mapped bytes, nothing else is decoded until a section is asked for.
+
+    Attributes:
+        path (str): Path of the report file.
+    """
+    # First line of every section of a text report, indented by its heading level
+    section_pattern = re.compile(rb'^ *Heading Level (\d+) Title: (.*)$', re.MULTILINE)
+
+    def __init__(self, path):
+        """
+        Initializes an instance of the ReportFile class and indexes its sections.
+
+        Args:
+            path (str): Path of the report file.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        size = self._file.seek(0, io.SEEK_END)
+        # An empty file cannot be mapped, and has nothing to index
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._headings = []
+        self._offsets = []
+        for match in self.section_pattern.finditer(self._data):
+            self._headings.append((int(match.group(1)), match.group(2).decode('utf-8', 'replace')))
+            self._offsets.append(match.start())
+        self._offsets.append(size)
+
+    def header_text(self):
+        """Returns the top of the report, before the first section."""
+        return self._data[:self._offsets[0]].decode('utf-8', 'replace')
+
+    def headings(self):
+        """Returns the (heading level, heading) of every section, in document order."""
+        return self._headings
+
+    def section_text(self, index):
+        """Returns the text report of one section, without the blank lines separating it from the next."""
+        text = self._data[self._offsets[index]:self._offsets[index + 1]].decode('utf-8', 'replace')
+        return text[:-2] if index < len(self._headings) - 1 and text.endswith('\n\n') else text
+
+    def to_text(self):
+        """Returns the whole report."""
+        return self._data[:].decode('utf-8', 'replace')
+
+    def close(self):
+        """Unmaps and closes the file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
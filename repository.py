@@ -0,0 +1,224 @@
+import datetime
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from instrumentation import instrument
+
+# Name of the SQLite index inside the repository directory
+INDEX_NAME = 'index.sqlite3'
+
+# Report files written before the index existed: repository-<file name>-<n>.txt
+LEGACY_REPORT_PATTERN = re.compile(r'^repository-(.+)-(\d+)\.txt$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL,
+    source_path TEXT,
+    content_hash TEXT,
+    created_at TEXT NOT NULL,
+    words INTEGER,
+    bold INTEGER,
+    italics INTEGER,
+    headers INTEGER,
+    report_file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_file_name ON reports (file_name, id);
+CREATE INDEX IF NOT EXISTS reports_source_path ON reports (source_path, id);
+CREATE INDEX IF NOT EXISTS reports_content_hash ON reports (content_hash, id);
+CREATE INDEX IF NOT EXISTS reports_created_at ON reports (created_at);
+"""
+
+# Columns of a report record, in the order returned by queries
+COLUMNS = ('id', 'file_name', 'source_path', 'content_hash', 'created_at',
+           'words', 'bold', 'italics', 'headers', 'report_file')
+
+
+class ReportRepository:
+    """
+    Repository of generated reports with an SQLite index of their metadata.
+
+    Report texts are kept as repository-<file name>-<id>.txt files, so they can still be opened from
+    the GUI history, while the index holds the source path, content hash, timestamp and totals of
+    every report. Saving, listing, querying and fetching reports use the index and never scan the
+    directory, so they stay fast as the history grows.
+
+    Attributes:
+        directory (str): The repository directory.
+    """
+
+    def __init__(self, directory='./repository'):
+        """
+        Initializes an instance of the ReportRepository class, creating the directory and index if missing.
+
+        Args:
+            directory (str): The repository directory.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_NAME)
+        new_index = not os.path.exists(index_path)
+
+        # The GUI saves from worker threads, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+        if new_index:
+            self._import_existing_reports()
+
+    def _import_existing_reports(self):
+        """
+        Indexes the report files written before the index existed, keeping their numbers as ids.
+
+        The old numbers were a count of the files in the directory, so two reports can share one
+        after a report was deleted. The oldest keeps the number and the others get fresh ids, which
+        are above every old number so that no later report file can overwrite an old one.
+        """
+        reports = []
+        for entry in os.scandir(self.directory):
+            match = LEGACY_REPORT_PATTERN.match(entry.name)
+            if match and entry.is_file():
+                mtime = entry.stat().st_mtime
+                reports.append((int(match.group(2)), mtime, match.group(1), entry.name))
+        numbered = []
+        renumbered = []
+        for number, mtime, file_name, report_file in sorted(reports):
+            created_at = datetime.datetime.fromtimestamp(mtime).isoformat(timespec='seconds')
+            if numbered and numbered[-1][0] == number:
+                renumbered.append((file_name, created_at, report_file))
+            else:
+                numbered.append((number, file_name, created_at, report_file))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT INTO reports (id, file_name, created_at, report_file) VALUES (?, ?, ?, ?)', numbered)
+            self._connection.executemany(
+                'INSERT INTO reports (file_name, created_at, report_file) VALUES (?, ?, ?)', renumbered)
+
+    @instrument('repository.save', size=lambda report_id, self, report, *args, **kwargs: len(report))
+    def save(self, report, file_name, source_path=None, content_hash=None, totals=None):
+        """
+        Writes a report file and indexes it.
+
+        Args:
+            report (str): The report text.
+            file_name (str): Name of the analyzed file.
+            source_path (str): Path of the analyzed file.
+            content_hash (str): SHA-256 of the analyzed file.
+            totals (dict): The document totals, keyed 'words', 'bold', 'italics' and 'headers'.
+
+        Returns:
+            int: The id of the saved report.
+        """
+        def write(report_path):
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(report)
+        return self._add(write, file_name, source_path, content_hash, totals)
+
+    @instrument('repository.save')
+    def save_file(self, path, file_name, source_path=None, content_hash=None, totals=None):
+        """
+        Indexes a report that was already written to a file, e.g. streamed by a worker process, and moves the file in.
+
+        Args:
+            path (str): The report file. It should be in the repository directory, so it is renamed rather than copied.
+            file_name (str): Name of the analyzed file.
+            source_path (str): Path of the analyzed file.
+            content_hash (str): SHA-256 of the analyzed file.
+            totals (dict): The document totals, keyed 'words', 'bold', 'italics' and 'headers'.
+
+        Returns:
+            int: The id of the saved report.
+        """
+        return self._add(lambda report_path: shutil.move(path, report_path), file_name, source_path, content_hash, totals)
+
+    def _add(self, write, file_name, source_path, content_hash, totals):
+        """Indexes a report and calls write(path) to put its file where the index expects it."""
+        totals = totals or {}
+        created_at = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO reports (file_name, source_path, content_hash, created_at, words, bold, italics, headers, report_file)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (file_name, source_path, content_hash, created_at, totals.get('words'), totals.get('bold'),
+                 totals.get('italics'), totals.get('headers'), ''))
+            report_id = cursor.lastrowid
+            report_file = "repository-" + file_name + "-" + str(report_id) + ".txt"
+            write(os.path.join(self.directory, report_file))
+            self._connection.execute('UPDATE reports SET report_file = ? WHERE id = ?', (report_file, report_id))
+        return report_id
+
+    def _query(self, sql, parameters=()):
+        """Runs a query and returns its rows as dicts."""
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def get(self, report_id):
+        """Returns the metadata of a report, or None if there is no such report."""
+        rows = self._query(f'SELECT {", ".join(COLUMNS)} FROM reports WHERE id = ?', (report_id,))
+        return rows[0] if rows else None
+
+    def path(self, report_id):
+        """Returns the path of a report file, or None if there is no such report."""
+        record = self.get(report_id)
+        return os.path.join(self.directory, record['report_file']) if record else None
+
+    def read(self, report_id):
+        """Returns the text of a report, or None if there is no such report."""
+        path = self.path(report_id)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def list(self, file_name=None, source_path=None, content_hash=None, since=None, limit=50, offset=0):
+        """
+        Lists report metadata, newest first, optionally filtered.
+
+        Args:
+            file_name (str): Only reports of files with this name.
+            source_path (str): Only reports of the file at this path.
+            content_hash (str): Only reports of files with this content.
+            since (str): Only reports created at or after this ISO timestamp.
+            limit (int): Maximum number of reports returned.
+            offset (int): Number of matching reports skipped, for paging.
+
+        Returns:
+            list: The metadata dict of every matching report.
+        """
+        conditions = []
+        parameters = []
+        for column, value in (('file_name', file_name), ('source_path', source_path), ('content_hash', content_hash)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                parameters.append(value)
+        if since is not None:
+            conditions.append('created_at >= ?')
+            parameters.append(since)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self._query(f'SELECT {", ".join(COLUMNS)} FROM reports{where} ORDER BY id DESC LIMIT ? OFFSET ?',
+                           (*parameters, limit, offset))
+
+    def latest(self, file_name=None, source_path=None):
+        """Returns the metadata of the newest report, optionally of one file, or None."""
+        rows = self.list(file_name=file_name, source_path=source_path, limit=1)
+        return rows[0] if rows else None
+
+    def count(self):
+        """Returns the number of reports in the repository."""
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+
+    def close(self):
+        """Closes the index."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,99 @@
+"""
+Shared Markdown scanner used by every section analyzer.
+
+The built-in kinds of tokens (code blocks, headers, block quotes, list items, inline code, bold,
+italics, links and sentences) are produced together by the Markdown frontend in one linear pass,
+see `markdown_frontend.tokenize`. Kinds added with `register` are regular expressions, compiled
+once and scanned separately.
+
+A `Scan` exposes the tokens of a text. Nothing is scanned until a kind is first asked for, and each
+pass runs at most once per text, so a new metric registered with `register` reuses the tokens the
+other metrics already paid for.
+"""
+import heapq
+import re
+from instrumentation import instrument
+from markdown_frontend import KINDS, Token, tokenize
+
+# kind -> (compiled pattern, value group) of the kinds added with `register`
+_kinds = {}
+
+
+def register(kind, pattern, value_group=0, line_anchored=False):
+    """
+    Adds a kind of match to the scanner.
+
+    Args:
+        kind (str): Name of the kind, e.g. 'table_row'.
+        pattern (str): The regular expression, with inline flags such as (?s:...) if it needs any.
+        value_group (int): The group of a match used as the token value, 0 for the whole match.
+        line_anchored (bool): Whether the pattern only matches at the start of a line (without a leading ^).
+
+    Raises:
+        ValueError: If the kind is produced by the Markdown frontend.
+    """
+    if kind in KINDS:
+        raise ValueError(f"{kind} tokens are produced by the Markdown frontend")
+    _kinds[kind] = (re.compile(r'(?m:^)' + pattern if line_anchored else pattern), value_group)
+
+
+class Scan:
+    """
+    Lazily scanned stream of the tokens of every kind in one text.
+
+    Attributes:
+        text (str): The scanned text.
+    """
+    __slots__ = ('text', '_matches', '_tokens')
+
+    def __init__(self, text):
+        """
+        Initializes an instance of the Scan class, nothing is scanned until tokens are asked for.
+
+        Args:
+            text (str): The text to scan.
+        """
+        self.text = text
+        self._matches = {} # kind -> re.Match list of the registered kinds scanned so far
+        self._tokens = {} # kind -> Token list of the kinds asked for so far
+
+    def _registered_matches(self, kind):
+        """Returns the match objects of a registered kind, scanning for them on first use."""
+        matches = self._matches.get(kind)
+        if matches is None:
+            matches = self._matches[kind] = self._find(kind)
+        return matches
+
+    @instrument(lambda self, kind: 'scan.' + kind, size=lambda matches, self, kind: len(self.text))
+    def _find(self, kind):
+        """Scans the text for the matches of a registered kind."""
+        return list(_kinds[kind][0].finditer(self.text))
+
+    def tokens(self, kind):
+        """Returns the tokens of one kind, in text order, scanning for them on first use."""
+        tokens = self._tokens.get(kind)
+        if tokens is None:
+            if kind in KINDS:
+                self._tokens.update(tokenize(self.text))
+                tokens = self._tokens[kind]
+            else:
+                value_group = _kinds[kind][1]
+                tokens = self._tokens[kind] = [Token(kind, match.start(), match.end(), match.group(value_group))
+                                               for match in self._registered_matches(kind)]
+        return tokens
+
+    def count(self, kind):
+        """Returns the number of tokens of one kind, without building tokens for registered kinds."""
+        if kind in KINDS:
+            return len(self.tokens(kind))
+        return len(self._registered_matches(kind))
+
+    def stream(self, kinds=None):
+        """Yields the tokens of the given kinds, all kinds by default, merged in text order."""
+        kinds = kinds or KINDS + tuple(_kinds)
+        return heapq.merge(*(self.tokens(kind) for kind in kinds), key=lambda token: token.start)
+
+
+def scan(text):
+    """Returns the lazily scanned token stream of a text."""
+    return Scan(text)
@@ -1,13 +1,167 @@
-import re
-from determine_language import CodeLanguageIdentifier
+import hashlib
+from determine_language import code_identifier as shared_code_identifier
+from instrumentation import instrument
+from report import SectionResult, section_alerts
+from scanner import scan
+
+
+class SectionMetrics:
+    """
+    Compact record holding every metric of a Markdown section.
+
+    The record is filled once by `from_content` from the token stream of the shared scanner, so
+    callers never have to re-scan the section to get another number.
+    """
+    __slots__ = ('words', 'bold', 'italics', 'sentences', 'paragraphs', 'inline_code',
+                 'block_quotes', 'headers', 'list_lengths', 'internal_links', 'external_links',
+                 'code_blocks', 'code_languages')
+
+    # List of languages that may be stated on the first line of a code block
+    languages_to_check = ("python", "jd", "java", "cpp", "rust", "kotlin")
+
+    @classmethod
+    @instrument('section.metrics', size=lambda metrics, cls, raw_content, *args: len(raw_content))
+    def from_content(cls, raw_content, code_identifier=None):
+        """
+        Tokenizes the raw content of a section and fills a new metrics record.
+
+        Args:
+            raw_content (str): The raw Markdown content of the section.
+            code_identifier (CodeLanguageIdentifier): Identifier used for unlabelled code blocks.
+
+        Returns:
+            SectionMetrics: The filled metrics record.
+        """
+        metrics = cls()
+        tokens = scan(raw_content)
+        metrics.words = len(raw_content.split())
+        metrics.sentences = tokens.count('sentence') if raw_content.strip() else 0
+
+        # Condition checks to see if p is empty after stripping new line characters to avoid counting empty paragraph returns
+        metrics.paragraphs = sum(1 for p in raw_content.split('\n\n') if p.strip())
+        metrics.inline_code = tokens.count('inline_code')
+        metrics.bold = cls._bold_words(tokens.tokens('bold'))
+        metrics.italics = tokens.count('italic')
+        metrics.headers = tokens.count('header')
+        metrics.block_quotes = tokens.count('quote')
+        metrics.list_lengths = cls._list_lengths(tokens.tokens('list_item'), raw_content)
+
+        metrics.internal_links = []
+        metrics.external_links = []
+        for token in tokens.tokens('link'):
+            if token.value.startswith("http"):
+                metrics.external_links.append(token.value)
+            else:
+                metrics.internal_links.append(token.value)
+
+        metrics.code_blocks = [token.value for token in tokens.tokens('code_block')]
+        metrics.code_languages = cls._code_languages(metrics.code_blocks, code_identifier)
+        return metrics
+
+    def to_dict(self):
+        """Returns the record as a JSON-serializable dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        """Rebuilds a record from the dict returned by `to_dict`."""
+        metrics = cls()
+        for name in cls.__slots__:
+            setattr(metrics, name, values[name])
+        return metrics
+
+    @staticmethod
+    def _bold_words(bold_tokens):
+        """Counts the words of the bold spans, words of a bold span nested in another are counted once."""
+        words = 0
+        outer_end = -1
+        for token in bold_tokens:
+            if token.end > outer_end:
+                words += len(token.value.split())
+                outer_end = token.end
+        return words
+
+    @staticmethod
+    def _list_lengths(list_items, raw_content):
+        """Returns the length of every run of list items on consecutive lines."""
+        lists = []
+        previous_start = None
+        for item in list_items:
+            # The item continues the current list if it starts on the line right after the previous item
+            if previous_start is not None and raw_content.count('\n', previous_start, item.start) == 1:
+                lists[-1] += 1
+            else:
+                lists.append(1)
+            previous_start = item.start
+        return lists
+
+    @classmethod
+    @instrument('language_detection', size=lambda languages, cls, code_blocks, *args: sum(map(len, code_blocks)))
+    def _code_languages(cls, code_blocks, code_identifier):
+        """Returns the stated or detected language of every code block."""
+        code_languages = []
+        unlabelled = [] # (index, stripped block) of the blocks whose language has to be detected
+        for block in code_blocks:
+            # Split the block by spaces and take the first word, empty blocks have none
+            words = block.split()
+            first_word = words[0].lower() if words else ""
+            # Check if the first word is in the list of languages
+            if first_word in cls.languages_to_check:
+                code_languages.append(first_word)
+            else:
+                unlabelled.append((len(code_languages), block.strip()))
+                code_languages.append(None)
+
+        if unlabelled:
+            detected = (code_identifier or shared_code_identifier).identify_languages(block for _, block in unlabelled)
+            for (index, _), language in zip(unlabelled, detected):
+                if language == "Unknown":
+                    code_languages[index] = "Not explicitly stated, unable to detect."
+                else:
+                    code_languages[index] = f"Not explicitly stated. Best guess: {language.capitalize()}"
+        return code_languages
+
+
+class SubtreeMetrics:
+    """
+    Metrics of a section and all of its subsections, rolled up once when the heading tree is built.
+    """
+    __slots__ = ('headers', 'words', 'bold', 'italics', 'internal_links', 'external_links', 'code_blocks', 'alerts')
+
+    @classmethod
+    def of_section(cls, section):
+        """Returns the metrics of the section alone, before its subsections are added."""
+        m = section.metrics
+        subtree = cls()
+        subtree.headers = 1
+        subtree.words = m.words
+        subtree.bold = m.bold
+        subtree.italics = m.italics
+        subtree.internal_links = len(m.internal_links)
+        subtree.external_links = len(m.external_links)
+        subtree.code_blocks = len(m.code_blocks)
+        subtree.alerts = len(section_alerts(m))
+        return subtree
+
+    def add(self, other):
+        """Adds the metrics of a finished subtree, e.g. of a subsection."""
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_dict(self):
+        """Returns the metrics as a JSON-serializable dict."""
+        return {name: getattr(self, name) for name in self.__slots__}
 
 
 class MarkdownSection:
     """
     Represents a section of Markdown text with various methods to analyze its content.
+
+    Every metric is read from a `SectionMetrics` record that is computed the first time it is
+    needed and cached, so `raw_content` should be treated as read-only once the section is built.
     """
 
-    def __init__(self, heading, heading_level, raw_content):
+    def __init__(self, heading, heading_level, raw_content, metrics=None):
         """
         Initialzes an instance of the MarkdownSection class.
 
@@ -15,33 +169,50 @@ class MarkdownSection:
             heading (str): The heading/title of the Markdown section.
             heading_level (int): The level of the heading (e.g. 1 for top-level, 2 for sub-section, ...)
             raw_content (str): The raw Markdown content of the section.
+            metrics (SectionMetrics): Previously computed metrics of raw_content, e.g. from a cache.
         """
         self.heading = heading
         self.heading_level = heading_level
         self.raw_content = raw_content
         self.subsections = [] # List to hold subsections
-        self.header_total = 1 # Total number of headers in the section.
-        
+        self.header_total = 1 # Total number of headers in the section and its subsections.
+        self.subtree = None # SubtreeMetrics of the section and its subsections, set when the heading tree is built
+        self._metrics = metrics # Cached SectionMetrics, filled on first use
+
+    @property
+    def metrics(self):
+        """The cached metrics record of the section, computed on first access."""
+        if self._metrics is None:
+            self._metrics = SectionMetrics.from_content(self.raw_content)
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        """Reuses metrics already computed for the same raw content."""
+        self._metrics = metrics
+
+    def fingerprint(self):
+        """Returns a hash of the heading and raw content that identifies an unchanged section."""
+        fingerprint = hashlib.blake2b(digest_size=16)
+        fingerprint.update(f"{self.heading_level}\0{self.heading}\0".encode('utf-8'))
+        fingerprint.update(self.raw_content.encode('utf-8'))
+        return fingerprint.hexdigest()
+
     def word_count(self):
         """Counts the number of words in the raw content."""
-        return len(self.raw_content.split())
+        return self.metrics.words
 
     def sentence_count(self):
         """Counts the number of sentences in the raw content."""
-        sentence_pattern = r'[.!?](\s+|$)'
-        return len(re.findall(sentence_pattern, self.raw_content)) if self.raw_content.strip() else 0
+        return self.metrics.sentences
 
     def paragraph_count(self):
         """Counts the number of paragraphs in the raw content."""
-        
-        # Condition checks to see if p is empty after stripping new line characters to avoid counting empty paragraph returns
-        paragraphs = [p for p in self.raw_content.split('\n\n') if p.strip()]
-        return len(paragraphs)
+        return self.metrics.paragraphs
     
     def inline_code_count(self):
         """Counts the number of inline code blocks in the raw content."""
-        code_pattern = r'(?<!`)`([^`]+)`(?!`)'
-        return len(re.findall(code_pattern, self.raw_content))
+        return self.metrics.inline_code
     
     def add_subsection(self, subsection):
         """Adds a subsection to the current section."""
@@ -50,69 +221,24 @@ class MarkdownSection:
         
     def bold_count(self): 
         """Counts the total number of bold words in the raw content."""
-        bold_pattern = r'\*\*([^\*]+)\*\*'
-        bold_matches = re.findall(bold_pattern, self.raw_content)
-        bold_num = sum(len(word.split()) for word in bold_matches)
-        return bold_num
+        return self.metrics.bold
         
     def header_count(self):
         """Counts the number of headers in the raw content."""
-        header_pattern = r'^#+\s.*'
-        header_num = re.findall(header_pattern, self.raw_content, flags=re.MULTILINE)
-        return len(header_num)
+        return self.metrics.headers
     
     def italic_count(self): 
         """Counts the nubmer of italicized words in the raw content"""
-
-        # Regular expression to find italic markdown syntax
-        italic_pattern = r'\*([^*]+)\*'
-        # Find all matches of italic syntax in the markdown text
-        italic_matches = re.findall(italic_pattern, self.raw_content)
-        # Count the number of italic occurrences
-        num_italics = len(italic_matches)
-        return num_italics
+        return self.metrics.italics
     
     def block_quote_count(self):
         """Counts the number of block quotes in the raw content."""
-        # Set up the regex for a block quote.   @auth ZE
-        quote_pattern=r'^>+\s.*'
-        # Find all block quotes and count them. @auth ZE
-        quotes_num = re.findall(quote_pattern,self.raw_content, flags=re.MULTILINE)   
-        # Return the number of block quotes.    @auth ZE
-        return len(quotes_num)
+        return self.metrics.block_quotes
    
     def list_count(self):
         """Counts the number of lists in the raw content."""
-
-        # Regular expression to find list markdown syntax
-        list_pattern = r'^(\s*)(\*|\+|-|\d+\.)\s+'
-        # Splitting content into lines to apply the pattern
-        lines = self.raw_content.split('\n')
-        
-        lists=[]
-        current_list = 0
-        lists = []
-        # Count the number of list occurrences, and tracking list length
-        for line in lines:
-                if re.match(list_pattern, line):
-                    if current_list == 0:
-                        current_list = 1
-                    else:
-                        current_list += 1         
-                else:
-                    if current_list > 0:
-                        # If current line not in a list add its length to the lists 
-                        # reset the current list length
-                        lists.append(current_list)
-                      
-                        current_list = 0
-         
-        # Additional check to see if the last list in the document was counted
-        if current_list > 0:
-            lists.append(current_list)
-        num_lists=len(lists)
-            
-        return num_lists, lists
+        lists = list(self.metrics.list_lengths)
+        return len(lists), lists
 
     def is_internal_link(self, link):
         """Determines if a link is internal or external"""
@@ -120,93 +246,12 @@ class MarkdownSection:
 
     def analyze_hyperlinks(self):
         """Extracts and analyzes hyperlinks in the raw content."""
-        internal_links = []
-        external_links = []
-
-        hyperlink_pattern = r'\[.*?\]\((.*?)\)'
-
-        links = re.findall(hyperlink_pattern, self.raw_content)
-
-        for link in links:
-            if self.is_internal_link(link):
-                internal_links.append(link)
-            else:
-                external_links.append(link)
-
-        return internal_links, external_links
+        return list(self.metrics.internal_links), list(self.metrics.external_links)
 
     def analyze_code_blocks(self):
-        code_identifier = CodeLanguageIdentifier()
-        code_blocks = re.findall(r'```(.*?)```', self.raw_content, re.DOTALL)
-        code_languages = []
-
-        # List of languages to check for
-        languages_to_check = ["python", "jd", "java", "cpp", "rust", "kotlin"]
-
-
-        if code_blocks:
-            for block in code_blocks:
-                first_block = block
-                # Split the first block by spaces and take the first word
-                first_word = first_block.split()[0].lower()
-                # Check if the first word is in the list of languages
-                if first_word in languages_to_check:
-                    language = first_word
-                    code_languages.append(language)
-                else:
-                    clean_block = block.strip()
-                    if code_identifier.identify_language(clean_block) == "Unknown":
-                        identified_language = "Not explicitly stated, unable to detect."
-                    else:
-                        identified_language = (f"Not explicitly stated. Best guess: {code_identifier.identify_language(clean_block).capitalize()}")
-                    code_languages.append(identified_language)
-        return code_blocks, code_languages
+        """Extracts the code blocks in the raw content and their stated or detected languages."""
+        return list(self.metrics.code_blocks), list(self.metrics.code_languages)
 
     def __str__(self):
         """Generates/prints a string representation of the MarkdownSection object/instance."""
-        num_lists, list_lengths = self.list_count()
-        tab = '    ' * (self.heading_level - 1)  # This adds an indent for each level subsection to create an
-        
-        # Analyze hyperlinks
-        internal_links, external_links = self.analyze_hyperlinks()
-        code_blocks, code_languages = self.analyze_code_blocks()
-        section_str = (
-            (f"{tab}Heading Level {self.heading_level} Title: {self.heading}\n") + \
-            (f"{tab}* Words: {self.word_count()}\n" if self.word_count() > 0 else "") + \
-            (f"{tab}* Bold Words: {self.bold_count()}\n" if self.bold_count() > 0 else "") + \
-            (f"{tab}* Sentences: {self.sentence_count()}\n" if self.sentence_count() > 0 else "") + \
-            (f"{tab}* Paragraphs: {self.paragraph_count()}\n" if self.paragraph_count() > 0 else "") + \
-            (f"{tab}* Italics: {self.italic_count()}\n" if self.italic_count() > 0 else "") + \
-            (f"{tab}* Inline Code Blocks: {self.inline_code_count()}\n" if self.inline_code_count() > 0 else "") + \
-            (f"{tab}* Block Quotes: {self.block_quote_count()}\n" if self.block_quote_count() > 0 else "") + \
-            (f"{tab}* Internal Links: {internal_links}\n" if internal_links else "") + \
-            (f"{tab}* External Links: {external_links}\n" if external_links else "") + \
-            (f"{tab}* Lists: {num_lists}\n" if num_lists > 0 else ""))
-        
-        # adding individual list length
-        for i, length in enumerate(list_lengths, start=1):
-            section_str += f"{tab}   - Length of List {i}: {length}\n"
-        
-        section_str += (f"{tab}* Code Blocks: {len(code_blocks)}\n" if len(code_blocks) > 0 else "")
-        
-        # adding code block languages
-        for i, language in enumerate(code_languages, start=1):
-            section_str += f"{tab}   - Code Block {i}: Language - {language.capitalize()}\n"
-
-        # Print flag to user if there are more hyperlinks than words in section
-        if (len(internal_links) + len(external_links)) > self.word_count():
-            section_str += f"{tab}* There are too many hyperlinks in your input document, considering removing some.\n"
-        
-        if self.word_count() > 0:
-            italics_words_ratio = self.italic_count()/self.word_count()
-            bold_words_ratio = self.bold_count()/self.word_count()
-
-            # Print flag to user if italics/word ratio is over 50%
-            if italics_words_ratio > 0.08:
-                section_str += f"{tab}* There are too many italicized words in this section.\n"
-
-            # Print flag to user if bold_words/total_word ratio is over 50%
-            if bold_words_ratio > 0.08:
-                section_str += f"{tab}* There are too many bolded words in this section.\n"
-
-        return section_str
\ No newline at end of file
+        return SectionResult.from_section(self).to_text()
\ No newline at end of file
@@ -0,0 +1,490 @@
+"""
+Local HTTP/JSON analysis service, e.g. for an LMS ingestion pipeline.
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8765] [--workers N] [--queue-size 64] [--root .]
+                      [--cache ./cache | --no-cache] [--max-body-mb 32] [--profile] [--conversion-timeout 60]
+
+Endpoints:
+    POST /analyze   Analyzes a batch of documents, uploaded or given as paths below --root:
+                        {"documents": [{"name": "intro.md", "content": "# Introduction ..."},
+                                       {"name": "syllabus.docx", "content_base64": "UEsDBBQ..."},
+                                       {"path": "cs263-Public/module-01/intro.md"}]}
+                    and answers {"results": [...], "seconds": ...}, one result per document, in order.
+                    Answers 503 with a Retry-After header while the queue is full.
+    GET /health     Worker warm-up state, queue occupancy, throughput and conversion pool statistics, as JSON.
+    GET /metrics    Request, document and byte counters, queue gauges and, with --profile, the analysis
+                    stages, in the Prometheus text format.
+"""
+import argparse
+import base64
+import binascii
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import batch
+import instrumentation
+from analysis import analyze_markdown, needs_conversion
+from cache import AnalysisCache
+from conversion import CONVERSION_TIMEOUT, ConversionPool, conversion_error, needs_pandoc
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = 'course_companion_service'
+
+# Analyzed by every worker at startup, so the first request does not pay for the lazy initialization
+WARM_UP_DOCUMENT = [
+    "# Warm Up\n",
+    "\n",
+    "Some *italic* and **bold** text with a [link](https://example.com) and `inline code`.\n",
+    "\n",
+    "```python\n",
+    "print('hello')\n",
+    "```\n",
+]
+
+
+class ServiceBusy(Exception):
+    """Raised when a batch does not fit in the queue, the client should retry later."""
+
+
+def init_worker(cache_dir, profile, ready):
+    """Opens the worker's cache, runs one analysis so everything it needs is loaded, and signals it is ready."""
+    batch.init_worker(cache_dir, profile)
+    analyze_markdown(WARM_UP_DOCUMENT, 'warm-up.md').to_report().to_dict()
+    instrumentation.reset()
+    ready.release()
+
+
+def analyze_items(items):
+    """
+    Analyzes a chunk of a batch in a worker process.
+
+    Args:
+        items (list): (file name, content bytes, None, content hash, Markdown) for an upload, (None, None, path,
+            content hash, Markdown) for a file. The content hash and Markdown are None unless the service
+            converted the document.
+
+    Returns:
+        list: One dict per item, see `batch.analyze_path`, with the size of the file and the report as a
+            JSON-serializable dict.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix='course-companion-') as directory:
+        for name, content, path, digest, converted in items:
+            try:
+                if path is None:
+                    # Conversion works on files, and the file extension tells the file type
+                    upload = os.path.join(directory, name)
+                    with open(upload, 'wb') as file:
+                        file.write(content)
+                    result = batch.analyze_path(upload, digest, converted)
+                    os.remove(upload)
+                    result['path'] = None
+                    result['bytes'] = len(content)
+                else:
+                    result = batch.analyze_path(path, digest, converted)
+                    result['bytes'] = os.path.getsize(path) if os.path.isfile(path) else 0
+            except OSError as error:
+                # Failing one document must not fail the rest of its batch
+                result = batch.new_result(path or name, str(error))
+                result.update(path=path, bytes=0)
+            if result['report'] is not None:
+                result['report'] = result['report'].to_dict()
+            results.append(result)
+    return results
+
+
+class AnalysisService:
+    """
+    Analyzes batches of documents on a pool of warm worker processes, with a bounded queue.
+
+    Documents count against the queue from the moment their batch is accepted until its results
+    are returned. A batch that does not fit is rejected as a whole instead of waiting, so a client
+    sending faster than the workers analyze is told to back off rather than piling up requests.
+    """
+
+    def __init__(self, workers=None, queue_size=64, cache_dir='./cache', root='.', profile=False,
+                 conversion_timeout=CONVERSION_TIMEOUT):
+        """
+        Initializes an instance of the AnalysisService class and starts its worker pool.
+
+        Args:
+            workers (int): Number of worker processes, defaults to the number of cores.
+            queue_size (int): Most documents accepted and not answered yet.
+            cache_dir (str): Directory of the analysis cache, None to analyze every document from scratch.
+            root (str): Directory the paths of a batch are relative to, paths outside of it are refused.
+            profile (bool): Record the wall time, calls and bytes of every analysis stage.
+            conversion_timeout (float): Seconds after which a pandoc conversion is killed and its document failed.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.root = os.path.realpath(root)
+        self.profile = profile
+        self.started = time.time()
+        self.warm = False
+        self.counters = Counter() # documents, failed, bytes, rejected, and requests by status code
+
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._busy_since = None # Start of the current stretch with at least one batch in progress
+        self._busy_seconds = 0.0
+
+        if profile:
+            instrumentation.reset()
+            instrumentation.enable()
+        self._ready = multiprocessing.Semaphore(0)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                             initargs=(cache_dir, profile, self._ready))
+        self._started = False
+        self._start_lock = threading.Lock()
+        # Documents that need pandoc are converted here, on threads, before they are sent to a worker
+        self._pool = ConversionPool(self.workers, conversion_timeout)
+        self._cache = AnalysisCache(cache_dir) if cache_dir else None
+
+    def _start_workers(self, timeout=None):
+        """Forks the worker processes once, before pandoc ever runs on the conversion threads, see batch.run_batch."""
+        with self._start_lock:
+            if not self._started:
+                self._executor.submit(batch.ping).result(timeout)
+                self._started = True
+
+    def warm_up(self, timeout=60):
+        """Starts every worker process and waits until each one has run its warm-up analysis."""
+        self._start_workers(timeout)
+        for future in [self._executor.submit(batch.ping) for _ in range(self.workers)]:
+            future.result(timeout)
+        self.warm = all([self._ready.acquire(timeout=timeout) for _ in range(self.workers)])
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+        self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _item(self, document):
+        """Validates one document of a batch and returns its worker item, raises ValueError if it is malformed."""
+        if not isinstance(document, dict):
+            raise ValueError("every document must be a JSON object")
+        if 'path' in document:
+            path = os.path.realpath(os.path.join(self.root, str(document['path'])))
+            if os.path.commonpath([self.root, path]) != self.root:
+                raise ValueError(f"{document['path']} is outside of the service root")
+            return None, None, path, None, None
+
+        name = str(document.get('name', ''))
+        if name in ('', '.', '..') or os.path.basename(name) != name:
+            raise ValueError(f"{name!r} is not a file name, an uploaded document needs one without directories")
+        if 'content' in document:
+            content = str(document['content']).encode('utf-8')
+        elif 'content_base64' in document:
+            try:
+                content = base64.b64decode(document['content_base64'], validate=True)
+            except (binascii.Error, TypeError) as error:
+                raise ValueError(f"{name}: invalid content_base64: {error}") from None
+        else:
+            raise ValueError(f"{name}: a document needs a path, content or content_base64")
+        return name, content, None, None, None
+
+    def _convert(self, items, directory):
+        """
+        Converts the documents of a batch that need pandoc on the conversion pool, like `batch.start_conversions`.
+
+        Args:
+            items (list): The worker items of the batch, see `analyze_items`.
+            directory (str): Directory the uploads are written to for pandoc.
+
+        Returns:
+            list: The (worker item, conversion error or None) of every document, the item has the content
+            hash and Markdown of the document if it was converted.
+        """
+        conversions = []
+        for name, content, path, _, _ in items:
+            digest = conversion = None
+            if needs_pandoc(path or name):
+                try:
+                    if self._cache is not None:
+                        if content is None:
+                            with open(path, 'rb') as file:
+                                digest = self._cache.digest(file.read())
+                        else:
+                            digest = self._cache.digest(content)
+                    if needs_conversion(path or name, self._cache, digest):
+                        source = path
+                        if source is None:
+                            source = os.path.join(directory, f"{len(conversions)}-{name}")
+                            with open(source, 'wb') as file:
+                                file.write(content)
+                        conversion = self._pool.submit(source)
+                except OSError:
+                    digest = None # The worker reports it
+            conversions.append((digest, conversion))
+
+        converted_items = []
+        for (name, content, path, _, _), (digest, conversion) in zip(items, conversions):
+            markdown = error = None
+            if conversion is not None:
+                try:
+                    markdown = conversion.result()
+                except Exception as conversion_failure:
+                    error = f"conversion failed: {conversion_error(conversion_failure)}"
+            converted_items.append(((name, content, path, digest, markdown), error))
+        return converted_items
+
+    def _reserve(self, count):
+        with self._lock:
+            if self._queued + count > self.queue_size:
+                self.counters['rejected'] += count
+                raise ServiceBusy(f"{self._queued} of {self.queue_size} queued documents")
+            if self._queued == 0:
+                self._busy_since = time.perf_counter()
+            self._queued += count
+
+    def _release(self, count):
+        with self._lock:
+            self._queued -= count
+            if self._queued == 0:
+                self._busy_seconds += time.perf_counter() - self._busy_since
+
+    def analyze(self, documents):
+        """
+        Analyzes a batch of documents on the worker pool.
+
+        Args:
+            documents (list): Dicts with the 'name' and 'content' (text) or 'content_base64' (bytes) of
+                an uploaded file, or the 'path' of a file below the service root.
+
+        Returns:
+            list: One dict per document, in order, with its name, path, error (None on success),
+            content hash, totals and report.
+
+        Raises:
+            ValueError: If a document is malformed.
+            ServiceBusy: If the queue has no room for the batch.
+        """
+        items = [self._item(document) for document in documents]
+        self._reserve(len(items))
+        try:
+            self._start_workers()
+            with tempfile.TemporaryDirectory(prefix='course-companion-') as directory:
+                converted = self._convert(items, directory)
+            # Chunked like the batch runs: few enough tasks to keep the pickling overhead low, enough to
+            # spread a batch over every worker
+            ready = [item for item, error in converted if error is None]
+            chunksize = max(1, len(ready) // (4 * self.workers))
+            futures = [self._executor.submit(analyze_items, ready[i:i + chunksize])
+                       for i in range(0, len(ready), chunksize)]
+            analyzed = iter([result for future in futures for result in future.result()])
+        finally:
+            self._release(len(items))
+
+        results = []
+        for (name, _, path, _, _), error in converted:
+            if error is not None:
+                result = batch.new_result(path or name, error)
+                result.update(path=path, bytes=0)
+            else:
+                result = next(analyzed)
+            results.append(result)
+
+        answers = []
+        with self._lock:
+            for (name, _, path, _, _), result in zip(items, results):
+                self.counters['documents'] += 1
+                self.counters['bytes'] += result['bytes']
+                if result['error'] is not None:
+                    self.counters['failed'] += 1
+                for key, value in result['cache'].items():
+                    self.counters[f'cache_{key}'] += value
+                answers.append({'name': name or result['file_name'], 'path': path and os.path.relpath(path, self.root),
+                                'error': result['error'], 'content_hash': result['content_hash'],
+                                'totals': result['totals'], 'report': result['report']})
+        for result in results:
+            instrumentation.merge(result['stages'])
+        return answers
+
+    def health(self):
+        """Returns the state of the service and its throughput while it was analyzing."""
+        with self._lock:
+            busy = self._busy_seconds + (time.perf_counter() - self._busy_since if self._queued else 0.0)
+            return {
+                'status': 'ok' if self.warm else 'starting',
+                'workers': self.workers,
+                'queued': self._queued,
+                'queue_size': self.queue_size,
+                'uptime_seconds': time.time() - self.started,
+                'busy_seconds': busy,
+                'documents': self.counters['documents'],
+                'failed': self.counters['failed'],
+                'rejected': self.counters['rejected'],
+                'documents_per_sec': self.counters['documents'] / busy if busy else 0.0,
+                'mb_per_sec': self.counters['bytes'] / 1e6 / busy if busy else 0.0,
+                'conversion': self._pool.stats(),
+            }
+
+    def to_prometheus(self):
+        """Renders the service counters and gauges, and the analysis stages if profiling, in the Prometheus text format."""
+        health = self.health()
+        with self._lock:
+            counters = dict(self.counters)
+        lines = []
+        for name, kind, description, samples in (
+                ('requests_total', 'counter', 'HTTP requests by status code.',
+                 [(f'{{code="{key[8:]}"}}', value) for key, value in sorted(counters.items()) if key.startswith('request_')]),
+                ('documents_total', 'counter', 'Documents analyzed.', [('', counters.get('documents', 0))]),
+                ('documents_failed_total', 'counter', 'Documents whose analysis failed.', [('', counters.get('failed', 0))]),
+                ('documents_rejected_total', 'counter', 'Documents refused because the queue was full.',
+                 [('', counters.get('rejected', 0))]),
+                ('bytes_total', 'counter', 'Bytes of the analyzed documents.', [('', counters.get('bytes', 0))]),
+                ('cache_hits_total', 'counter', 'Documents answered from the analysis cache.',
+                 [('', counters.get('cache_hits', 0))]),
+                ('busy_seconds_total', 'counter', 'Wall time with at least one batch in progress.',
+                 [('', health['busy_seconds'])]),
+                ('queued_documents', 'gauge', 'Documents accepted and not answered yet.', [('', health['queued'])]),
+                ('queue_size', 'gauge', 'Most documents accepted and not answered yet.', [('', self.queue_size)]),
+                ('workers', 'gauge', 'Worker processes.', [('', self.workers)]),
+                ('warm', 'gauge', 'Whether every worker finished its warm-up.', [('', int(self.warm))])):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {description}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+            lines.extend(f'{METRIC_PREFIX}_{name}{labels} {value}' for labels, value in samples)
+        text = '\n'.join(lines) + '\n'
+        if self.profile:
+            text += instrumentation.to_prometheus()
+        return text
+
+    def count_request(self, status):
+        with self._lock:
+            self.counters[f'request_{status}'] += 1
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Maps the HTTP endpoints to the AnalysisService of the server."""
+    protocol_version = 'HTTP/1.1' # Keep-alive, a pipeline sends many batches over one connection
+    server_version = 'CourseCompanion'
+
+    def send(self, status, body, content_type='application/json', headers=()):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body, separators=(',', ':'))
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.service.count_request(status)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self.send(200, self.server.service.health())
+        elif path == '/metrics':
+            self.send(200, self.server.service.to_prometheus(), 'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self.send(404, {'error': f"no such endpoint: {path}"})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        service = self.server.service
+        length = self.headers.get('Content-Length')
+        if path != '/analyze':
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.send(404, {'error': f"no such endpoint: {path}"})
+            return
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self.send(411, {'error': "a Content-Length header is required"})
+            return
+        if int(length) > self.server.max_body:
+            self.close_connection = True
+            self.send(413, {'error': f"request body larger than {self.server.max_body} bytes"})
+            return
+
+        try:
+            documents = json.loads(self.rfile.read(int(length)))['documents']
+            if not isinstance(documents, list):
+                raise ValueError("documents must be a list")
+        except (ValueError, KeyError, TypeError) as error:
+            self.send(400, {'error': f"expected {{\"documents\": [...]}}: {error}"})
+            return
+        if len(documents) > service.queue_size:
+            self.send(413, {'error': f"batch of {len(documents)} documents, the queue holds {service.queue_size}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            results = service.analyze(documents)
+        except ServiceBusy as error:
+            self.send(503, {'error': f"queue full: {error}"}, headers=[('Retry-After', '1')])
+        except ValueError as error:
+            self.send(400, {'error': str(error)})
+        except BrokenProcessPool:
+            self.send(500, {'error': "a worker process died, restart the service"})
+        except Exception as error:
+            # Whatever went wrong, the client gets an answer instead of a dropped connection
+            self.log_error("analysis failed: %r", error)
+            self.send(500, {'error': f"internal error: {error}"})
+        else:
+            self.send(200, {'results': results, 'seconds': time.perf_counter() - start})
+
+
+def serve(service, host='127.0.0.1', port=8765, max_body=32 * 1024 * 1024):
+    """Returns an HTTP server answering the service endpoints, call its serve_forever() to run it."""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_body = max_body
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the analyzer over HTTP/JSON.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument('--queue-size', type=int, default=64, help="most documents accepted and not answered yet")
+    parser.add_argument('--root', default='.', help="directory the document paths are relative to")
+    parser.add_argument('--cache', default='./cache', help="directory of the analysis cache")
+    parser.add_argument('--no-cache', action='store_true', help="analyze every document from scratch")
+    parser.add_argument('--max-body-mb', type=float, default=32, help="largest request body accepted, in MB")
+    parser.add_argument('--profile', action='store_true', help="export the analysis stages on /metrics")
+    parser.add_argument('--conversion-timeout', type=float, default=CONVERSION_TIMEOUT,
+                        help="seconds after which a pandoc conversion is stopped and its document failed")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a directory")
+
+    with AnalysisService(args.workers, args.queue_size, None if args.no_cache else args.cache, args.root,
+                         args.profile, args.conversion_timeout) as service:
+        start = time.perf_counter()
+        service.warm_up()
+        print(f"{service.workers} workers warmed up in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+        server = serve(service, args.host, args.port, int(args.max_body_mb * 1024 * 1024))
+        print(f"Listening on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import AnalysisCache
+
+
+def directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.json'))
+
+
+def test_eviction_trims_to_the_low_water_mark(tmp_path, monkeypatch):
+    cache = AnalysisCache(str(tmp_path), max_bytes=5000, low_water=0.8)
+    evictions = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: evictions.append(1) or evict())
+
+    for i in range(200):
+        cache.put('analysis', '1', f'digest-{i}', 'x' * 40)
+        assert directory_size(str(tmp_path)) <= 5000
+    # Every eviction frees a fifth of the cache, instead of scanning the directory on every put once it is full
+    assert len(evictions) < 30
+    assert cache.stats()['size'] == directory_size(str(tmp_path))
+
+    # The most recently written entries are kept
+    assert cache.get('analysis', '1', 'digest-199') == 'x' * 40
+    assert cache.get('analysis', '1', 'digest-0') is None
+
+
+def test_has_does_not_count_lookups(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+    cache.put('markdown', '1', 'digest', '# Title\n')
+    assert cache.has('markdown', '1', 'digest')
+    assert not cache.has('markdown', '2', 'digest')
+    assert (cache.hits, cache.misses) == (0, 0)
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import analyze_file
+from batch import run_batch
+from conversion import ConversionPool
+
+# Stands in for pandoc: hangs on HTML, fails on files named bad.*, converts everything else
+FAKE_PANDOC = """#!/bin/sh
+case "$5" in
+    *.html) exec sleep 30 ;;
+    */bad.*) echo "cannot read $5" >&2; exit 64 ;;
+esac
+printf '# Converted\\n\\nSome **bold** text.\\n'
+"""
+
+
+@pytest.fixture
+def fake_pandoc(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    pandoc = bin_dir / 'pandoc'
+    pandoc.write_text(FAKE_PANDOC)
+    pandoc.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    documents = tmp_path / 'course'
+    documents.mkdir()
+    for name in ('slow.html', 'bad.docx', 'good.docx', 'notes.md'):
+        (documents / name).write_text('# Notes\n\nSome text.\n')
+    return documents
+
+
+def test_slow_conversion_is_killed_and_counted(fake_pandoc):
+    with ConversionPool(max_workers=2, timeout=0.5) as pool:
+        start = time.perf_counter()
+        with pytest.raises(subprocess.TimeoutExpired):
+            pool.convert(str(fake_pandoc / 'slow.html'))
+        assert time.perf_counter() - start < 5
+        with pytest.raises(subprocess.CalledProcessError) as failure:
+            pool.convert(str(fake_pandoc / 'bad.docx'))
+        assert 'cannot read' in failure.value.stderr
+        assert pool.convert(str(fake_pandoc / 'good.docx')).startswith('# Converted')
+
+        stats = pool.stats()
+    assert (stats['completed'], stats['failed'], stats['in_flight']) == (1, 2, 0)
+
+
+def test_batch_converts_on_the_pool(fake_pandoc, tmp_path):
+    stats = run_batch(str(fake_pandoc), str(tmp_path / 'repository'), workers=2, cache_dir=str(tmp_path / 'cache'),
+                      conversion_timeout=0.5)
+
+    failed = dict(stats['failed'])
+    assert sorted(os.path.basename(path) for path in failed) == ['bad.docx', 'slow.html']
+    assert 'took longer than 0.5 s' in failed[str(fake_pandoc / 'slow.html')]
+    assert 'cannot read' in failed[str(fake_pandoc / 'bad.docx')]
+    assert (stats['conversion']['completed'], stats['conversion']['failed']) == (1, 2)
+
+
+def test_streamed_batch_matches_the_full_analysis(fake_pandoc, tmp_path):
+    # Without a cache or an export the workers stream pandoc's output into the report files
+    repository = tmp_path / 'repository'
+    stats = run_batch(str(fake_pandoc), str(repository), workers=2, cache_dir=None, conversion_timeout=0.5)
+
+    failed = dict(stats['failed'])
+    assert sorted(os.path.basename(path) for path in failed) == ['bad.docx', 'slow.html']
+    assert 'took longer than 0.5 s' in failed[str(fake_pandoc / 'slow.html')]
+    assert 'cannot read' in failed[str(fake_pandoc / 'bad.docx')]
+    # Only the finished reports are left in the repository
+    assert sorted(name for name in os.listdir(repository) if not name.endswith('.sqlite3')) == [
+        'repository-good.docx-1.txt', 'repository-notes.md-2.txt']
+    for name, report_file in (('good.docx', 'repository-good.docx-1.txt'), ('notes.md', 'repository-notes.md-2.txt')):
+        expected = analyze_file(str(fake_pandoc / name)).to_report().to_text()
+        assert (repository / report_file).read_text(encoding='utf-8') == expected
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linkcheck import HTTPFetcher, LinkCache, LinkChecker
+
+
+class StubFetcher:
+    """Answers from a url -> (status, error) table and records the fetched URLs."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.fetched = []
+
+    async def fetch(self, url):
+        self.fetched.append(url)
+        return self.responses.get(url, (404, None))
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_check(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, 'notes', 'setup.md'),
+          '# Getting Started\n\n<a id="Install-Steps"></a>\nSteps.\n')
+    write(os.path.join(root, 'index.md'), '\n'.join([
+        '# Index', '',
+        '[a](notes/setup.md) [b](notes/setup.md#getting-started) [c](notes/setup.md#Getting-Started)',
+        '[d](notes/setup.md#install-steps) [e](notes/setup.md#Install-Steps) [f](notes/setup.md#missing)',
+        '[g](missing.md) [h](mailto:someone@example.com)',
+        '[i](https://example.com/ok) [j](https://example.com/ok#part) [k](https://example.com/gone)', '']))
+
+    fetcher = StubFetcher({'https://example.com/ok': (200, None)})
+    results = LinkChecker(root, fetcher, LinkCache(None)).check()
+
+    assert [(result.link, result.kind, result.ok) for result in results] == [
+        ('notes/setup.md', 'internal', True),
+        ('notes/setup.md#getting-started', 'anchor', True),
+        ('notes/setup.md#Getting-Started', 'anchor', True),
+        ('notes/setup.md#install-steps', 'anchor', True),
+        ('notes/setup.md#Install-Steps', 'anchor', True),
+        ('notes/setup.md#missing', 'anchor', False),
+        ('missing.md', 'internal', False),
+        ('mailto:someone@example.com', 'skipped', True),
+        ('https://example.com/ok', 'external', True),
+        ('https://example.com/ok#part', 'external', True),
+        ('https://example.com/gone', 'external', False),
+    ]
+    assert results[-1].detail == 'HTTP 404'
+    # Each distinct URL is fetched once, without its fragment
+    assert sorted(fetcher.fetched) == ['https://example.com/gone', 'https://example.com/ok']
+
+
+def test_cached_results_are_not_fetched(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, 'index.md'), '# Index\n\n[a](https://example.com/a) [b](https://example.com/b)\n')
+    cache = LinkCache(None)
+    cache.put('https://example.com/a', 200, None)
+
+    fetcher = StubFetcher({'https://example.com/b': (200, None)})
+    results = LinkChecker(root, fetcher, cache).check()
+
+    assert [result.ok for result in results] == [True, True]
+    assert fetcher.fetched == ['https://example.com/b']
+
+
+def test_fetcher_is_reusable_across_event_loops():
+    fetcher = HTTPFetcher(per_host=1)
+    fetcher._check = lambda url: (200, None) # No network, only the per-host limits are exercised
+
+    async def fetch_all():
+        return await asyncio.gather(*(fetcher.fetch(f'https://example.com/{i}') for i in range(3)))
+
+    try:
+        # The second run has a new event loop, the semaphores of the first one cannot be reused
+        assert asyncio.run(fetch_all()) == [(200, None)] * 3
+        assert asyncio.run(fetch_all()) == [(200, None)] * 3
+    finally:
+        fetcher.close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answers like a small site and records (method, path, client port) of every request:
+    /ok is found, /no-head refuses HEAD, /redirect/<n> redirects n times, /loop redirects forever.
+    """
+    protocol_version = 'HTTP/1.1' # Keep-alive
+
+    def answer(self, body):
+        self.server.requests.append((self.command, self.path, self.client_address[1]))
+        if self.path == '/ok':
+            status, location = 200, None
+        elif self.path == '/no-head':
+            status, location = (405, None) if self.command == 'HEAD' else (200, None)
+        elif self.path.startswith('/redirect/'):
+            remaining = int(self.path.rsplit('/', 1)[1])
+            status, location = (302, f'/redirect/{remaining - 1}') if remaining else (200, None)
+        elif self.path == '/loop':
+            status, location = 302, '/loop'
+        else:
+            status, location = 404, None
+        content = b'<html>page</html>'
+        self.send_response(status)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+
+    def do_HEAD(self):
+        self.answer(body=False)
+
+    def do_GET(self):
+        self.answer(body=True)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    fetcher = HTTPFetcher(timeout=5, per_host=1, max_redirects=3)
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', server.requests, fetcher
+    finally:
+        fetcher.close()
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(fetcher, *urls):
+    async def fetch_all():
+        return [await fetcher.fetch(url) for url in urls]
+    return asyncio.run(fetch_all())
+
+
+def test_http_fetcher_statuses(site):
+    base, requests, fetcher = site
+    assert fetch(fetcher, f'{base}/ok', f'{base}/gone') == [(200, None), (404, None)]
+    assert [(method, path) for method, path, _ in requests] == [('HEAD', '/ok'), ('HEAD', '/gone')]
+
+
+def test_http_fetcher_falls_back_to_get(site):
+    base, requests, fetcher = site
+    assert fetch(fetcher, f'{base}/no-head') == [(200, None)]
+    assert [(method, path) for method, path, _ in requests] == [('HEAD', '/no-head'), ('GET', '/no-head')]
+
+
+def test_http_fetcher_follows_redirects(site):
+    base, requests, fetcher = site
+    assert fetch(fetcher, f'{base}/redirect/3') == [(200, None)]
+    assert [path for _, path, _ in requests] == ['/redirect/3', '/redirect/2', '/redirect/1', '/redirect/0']
+
+    # Past max_redirects the link is broken
+    assert fetch(fetcher, f'{base}/redirect/4', f'{base}/loop') == [(None, "too many redirects")] * 2
+    assert [path for _, path, _ in requests].count('/loop') == 4
+
+
+def test_http_fetcher_reuses_connections(site):
+    base, requests, fetcher = site
+    assert fetch(fetcher, *[f'{base}/ok'] * 5, f'{base}/redirect/2') == [(200, None)] * 6
+    # Every HEAD request of one host went over the same keep-alive connection
+    assert len({port for _, _, port in requests}) == 1
+
+
+def test_http_fetcher_connection_errors():
+    with socket.socket() as closed:
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+    fetcher = HTTPFetcher(timeout=5)
+    try:
+        [(status, error)] = fetch(fetcher, f'http://127.0.0.1:{port}/ok')
+        assert status is None and 'refused' in error.lower()
+        assert fetch(fetcher, 'ftp://example.com/file') == [(None, "unsupported scheme ftp")]
+    finally:
+        fetcher.close()
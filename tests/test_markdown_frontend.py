@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_frontend import iter_blocks, tokenize
+from section import SectionMetrics
+
+
+def links(text):
+    return [token.value for token in tokenize(text)['link']]
+
+
+def headings(lines):
+    return [(level, text) for level, text in iter_blocks(lines) if level]
+
+
+def values(text, kind):
+    return [token.value for token in tokenize(text)[kind]]
+
+
+def test_fenced_lines_are_not_headings():
+    lines = ['# Title\n', '```c\n', '#include <stdio.h>\n', '```\n',
+             '~~~\n', '# not a heading\n', '~~~\n', '## Next\n']
+    assert headings(lines) == [(1, 'Title'), (2, 'Next')]
+    assert values('```c\n#include <stdio.h>\n```\n# Real\n', 'header') == ['# Real']
+
+
+def test_setext_headings():
+    assert headings(['Title\n', '=====\n', 'text\n', '\n', 'Sub\n', '---\n']) == [(1, 'Title'), (2, 'Sub')]
+    # Without a paragraph above it, or with spaces, a dash line is a thematic break
+    assert headings(['---\n', 'text\n', '- - -\n']) == []
+
+
+def test_emphasis_pairs_like_commonmark():
+    assert values('***x***\n', 'bold') == ['x']
+    assert values('***x***\n', 'italic') == ['**x**']
+    assert values('**y** and *z*\n', 'bold') == ['y']
+    assert values('**y** and *z*\n', 'italic') == ['z']
+    assert values('snake_case_name and _under_\n', 'italic') == ['under']
+
+
+def test_code_is_opaque():
+    tokens = tokenize('Use `*a* [l](x). ` here\n\n```\n**b** [l](u). *c*\n```\n')
+    assert [len(tokens[kind]) for kind in ('inline_code', 'code_block')] == [1, 1]
+    assert [len(tokens[kind]) for kind in ('bold', 'italic', 'link', 'sentence')] == [0, 0, 0, 0]
+
+
+def test_tex_lines_are_dropped_and_escapes_kept():
+    assert list(iter_blocks(['\\bSidebar{Note}\n', '\\*escaped\\*\n'])) == [(0, '\\*escaped\\*\n')]
+    assert values('\\*escaped\\* text\n', 'italic') == []
+
+
+def test_thematic_breaks_are_not_lists():
+    assert values('* * *\n- - -\n___\n', 'list_item') == []
+    assert SectionMetrics.from_content('- a\n- b\n\n* * *\n\n1. c\n').list_lengths == [2, 1]
+
+
+def test_link_destinations():
+    assert links("[a](b) and [c](d (e) f)\n") == ['b', 'd (e) f']
+    # Not closed on its line, the next line does not close it
+    assert links("[a](b\nc)\n") == []
+    # A later destination closes even though an earlier one on the line did not
+    assert links("[a](b( [c](d)\n") == ['d']
+    # An escaped parenthesis neither opens nor closes
+    assert links("[a](\\)x) [b](c)\n") == ['\\)x', 'c']
+
+
+def test_unclosed_destinations_are_linear():
+    # Every `](` used to rescan the rest of the line: 80 KB of this took over a minute
+    start = time.perf_counter()
+    assert links("[a](" * 20000) == []
+    assert links("[a](" * 20000 + ")") == ['']
+    assert time.perf_counter() - start < 2
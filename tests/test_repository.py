@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import ReportRepository
+
+
+def test_existing_reports_are_imported(tmp_path):
+    # Reports written before the index: two share the number 2 after a report was deleted
+    for name, text, mtime in (('repository-a.md-1.txt', 'report a', 1000),
+                              ('repository-b.md-2.txt', 'report b', 2000),
+                              ('repository-c.md-2.txt', 'report c', 3000)):
+        path = tmp_path / name
+        path.write_text(text, encoding='utf-8')
+        os.utime(path, (mtime, mtime))
+
+    with ReportRepository(str(tmp_path)) as repository:
+        assert repository.count() == 3
+        records = {record['id']: record for record in repository.list()}
+        # The old numbers are kept as ids, the newer of the two reports numbered 2 gets a fresh id
+        assert {report_id: record['file_name'] for report_id, record in records.items()} == {
+            1: 'a.md', 2: 'b.md', 3: 'c.md'}
+        assert records[3]['report_file'] == 'repository-c.md-2.txt'
+        assert [repository.read(report_id) for report_id in (1, 2, 3)] == ['report a', 'report b', 'report c']
+
+        # The next report is numbered above every old one, so it cannot overwrite an old report file
+        assert repository.save('report d', 'd.md') == 4
+        assert repository.read(4) == 'report d'
+        assert repository.get(4)['report_file'] == 'repository-d.md-4.txt'
+        assert (tmp_path / 'repository-c.md-2.txt').read_text(encoding='utf-8') == 'report c'
+
+    # Opening the repository again does not import the files a second time
+    with ReportRepository(str(tmp_path)) as repository:
+        assert repository.count() == 4
@@ -0,0 +1,74 @@
+import http.client
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service import AnalysisService, serve
+
+
+@pytest.fixture(scope='module')
+def post(tmp_path_factory):
+    root = tmp_path_factory.mktemp('root')
+    (root / 'intro.md').write_text('# Intro\n\nSome **bold** text.\n', encoding='utf-8')
+    with AnalysisService(workers=1, queue_size=2, cache_dir=None, root=str(root)) as service:
+        server = serve(service, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def post(body):
+            """Posts a body to /analyze and returns the status and decoded answer."""
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=30)
+            try:
+                connection.request('POST', '/analyze', json.dumps(body), {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                return response.status, json.loads(response.read())
+            finally:
+                connection.close()
+
+        try:
+            yield post
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+@pytest.mark.parametrize('document', [{'name': '../a.md', 'content': '# A\n'}, {'name': '', 'content': '# A\n'},
+                                      {'path': '../a.md'}, {'name': 'a.md', 'content_base64': 'not base64!'},
+                                      {'name': 'a.md'}, 'a.md'])
+def test_malformed_documents_are_refused(post, document):
+    status, answer = post({'documents': [document]})
+    assert status == 400
+    assert answer['error']
+
+
+@pytest.mark.parametrize('body', [{}, {'documents': 'a.md'}, []])
+def test_malformed_batches_are_refused(post, body):
+    assert post(body)[0] == 400
+
+
+def test_oversized_batch(post):
+    status, answer = post({'documents': [{'name': f'{i}.md', 'content': '# A\n'} for i in range(3)]})
+    assert status == 413
+    assert 'the queue holds 2' in answer['error']
+
+
+def test_per_document_errors(post):
+    status, answer = post({'documents': [{'path': 'missing.md'}, {'name': 'slides.pdf', 'content': 'x'}]})
+    assert status == 200
+    missing, unsupported = answer['results']
+    assert missing['path'] == 'missing.md' and 'No such file' in missing['error']
+    assert unsupported['name'] == 'slides.pdf' and unsupported['error'] == 'Invalid file type .pdf'
+    assert missing['report'] is None and unsupported['report'] is None
+
+
+def test_analyze(post):
+    status, answer = post({'documents': [{'path': 'intro.md'}, {'name': 'notes.md', 'content': '# Notes\n\nText.\n'}]})
+    assert status == 200
+    intro, notes = answer['results']
+    assert (intro['error'], intro['path'], intro['totals']['bold']) == (None, 'intro.md', 1)
+    assert (notes['error'], notes['name'], notes['totals']['headers']) == (None, 'notes.md', 1)
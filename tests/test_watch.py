@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import ReportRepository
+from watch import CourseWatcher
+
+DEBOUNCE = 0.2
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def step(watcher):
+    """One round of the polling loop of CourseWatcher.run."""
+    watcher.poll()
+    watcher.process_events(0)
+    watcher.analyze_ready()
+
+
+def settle(watcher):
+    """Runs the polling loop until the debounce delay has passed."""
+    step(watcher)
+    time.sleep(DEBOUNCE * 1.5)
+    step(watcher)
+
+
+def test_polling_watcher(tmp_path):
+    course = tmp_path / 'course'
+    course.mkdir()
+    notes, lab = str(course / 'notes.md'), str(course / 'lab.md')
+    write(notes, '# Intro\n\nSome text.\n\n# Loops\n\nMore text.\n')
+    write(lab, '# Lab\n\nSteps.\n')
+
+    with ReportRepository(str(tmp_path / 'repository')) as repository:
+        watcher = CourseWatcher(str(course), repository, debounce=DEBOUNCE, polling=True)
+        watcher.prime()
+        step(watcher)
+        assert repository.count() == 0
+
+        # Rapid saves are debounced into one analysis, which reuses the section primed at startup
+        write(notes, '# Intro\n\nSome new text.\n\n# Loops\n\nMore text.\n')
+        step(watcher)
+        write(notes, '# Intro\n\nSome newer text.\n\n# Loops\n\nMore text.\n')
+        # A writer-set modification time does not count as the time of the change
+        os.utime(notes, (0, 0))
+        step(watcher)
+        assert repository.count() == 0
+        time.sleep(DEBOUNCE * 1.5)
+        step(watcher)
+        assert [record['source_path'] for record in repository.list()] == [notes]
+        assert (watcher._analyzers[notes].recomputed, watcher._analyzers[notes].reused) == (1, 1)
+        assert 0 < watcher.latencies[-1] < 5
+
+        # A save that changed nothing saves no report
+        os.utime(notes, (time.time(), time.time()))
+        settle(watcher)
+        assert repository.count() == 1
+
+        # A deleted file is forgotten
+        os.remove(notes)
+        settle(watcher)
+        assert notes not in watcher._analyzers and notes not in watcher._hashes
+        assert repository.count() == 1
+
+        # A moved file is forgotten under its old name and analyzed under its new one
+        moved = str(course / 'lab-1.md')
+        os.rename(lab, moved)
+        settle(watcher)
+        assert lab not in watcher._analyzers and moved in watcher._analyzers
+        assert repository.latest(source_path=moved)['file_name'] == 'lab-1.md'
+        assert repository.count() == 2
+
+
+def test_run_stops(tmp_path):
+    course = tmp_path / 'course'
+    course.mkdir()
+    with ReportRepository(str(tmp_path / 'repository')) as repository:
+        watcher = CourseWatcher(str(course), repository, debounce=DEBOUNCE, interval=0.05, polling=True)
+        stop = threading.Event()
+        thread = threading.Thread(target=watcher.run, args=(stop,))
+        thread.start()
+        try:
+            write(str(course / 'new.md'), '# New\n\nText.\n')
+            deadline = time.time() + 5
+            while repository.count() == 0 and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            stop.set()
+            thread.join(5)
+        assert not thread.is_alive()
+        assert repository.latest()['file_name'] == 'new.md'
@@ -0,0 +1,318 @@
+"""
+Watch mode: re-analyzes the files of a course directory whenever they change.
+
+Usage:
+    python watch.py "test files/cs263-Public" [--repository ./repository] [--debounce 0.2] [--interval 0.5] [--polling]
+                    [--aggregate aggregates.json [--corpus-root "test files"]]
+
+Changes are received as filesystem events (inotify, FSEvents, ...) when the optional `watchdog`
+package is installed, and found by polling the directory otherwise. Rapid saves of one file are
+debounced into a single analysis, and only the changed files are re-analyzed, section by section
+through an IncrementalAnalyzer per file. The analyzers are primed with every file when the watcher
+starts, so even the first edit of a file only re-analyzes its changed sections. Every fresh report
+is saved to the repository and the latency from the change to the saved report is printed.
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from aggregate import CorpusAggregator, default_root
+from analysis import IncrementalAnalyzer, read_markdown
+from batch import SUPPORTED_EXTENSIONS
+from cache import AnalysisCache
+from repository import ReportRepository
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError: # watchdog is optional, the watcher polls without it
+    Observer = None
+
+
+def is_supported(path):
+    """Returns whether a file type is analyzed by the watcher."""
+    return os.path.splitext(path)[-1].lower() in SUPPORTED_EXTENSIONS
+
+
+class CourseWatcher:
+    """
+    Watches a course directory and re-analyzes changed files.
+
+    Attributes:
+        directory (str): The watched directory.
+        repository (ReportRepository): Where the fresh reports are saved.
+        debounce (float): Seconds a file must stay unchanged before it is analyzed.
+        interval (float): Seconds between two scans of the directory when polling.
+        latencies (list): Seconds from each change to its saved report.
+        aggregator (CorpusAggregator): Per-course aggregates updated with every fresh report, if any.
+    """
+
+    def __init__(self, directory, repository, debounce=0.2, interval=0.5, polling=False, aggregates=None,
+                 corpus_root=None):
+        """
+        Initializes an instance of the CourseWatcher class and takes a snapshot of the directory.
+
+        Args:
+            directory (str): The directory to watch.
+            repository (ReportRepository): Where the fresh reports are saved.
+            debounce (float): Seconds a file must stay unchanged before it is analyzed.
+            interval (float): Seconds between two scans of the directory when polling.
+            polling (bool): Poll the directory even if filesystem events are available.
+            aggregates (str): Path of the corpus aggregates file updated with every fresh report.
+            corpus_root (str): Directory holding the course directories, defaults to the parent of directory.
+
+        Raises:
+            ValueError: If the aggregates file belongs to another corpus root.
+        """
+        self.directory = directory
+        self.repository = repository
+        self.debounce = debounce
+        self.interval = interval
+        self.polling = polling or Observer is None
+        self.latencies = []
+        self.aggregates = aggregates
+        self.aggregator = (CorpusAggregator.load(aggregates, corpus_root or default_root(directory))
+                           if aggregates else None)
+        self._events = queue.Queue() # (path, time of the change or None if deleted) from the event thread or the poller
+        self._pending = {} # path -> (time of the first change, time of the last change) waiting for the debounce
+        self._analyzers = {} # path -> IncrementalAnalyzer, keeping the sections of the last analysis
+        self._hashes = {} # path -> content hash of the last analysis, to skip saves that changed nothing
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        """Returns the modification time and size of every supported file below the directory."""
+        snapshot = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if is_supported(path):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        """Finds the files changed since the previous scan and queues them."""
+        snapshot = self._scan()
+        for path, signature in snapshot.items():
+            if self._snapshot.get(path) != signature:
+                # Timed from when the poll noticed the change: the modification time may be set by
+                # the writer (copies, checkouts, archives) or come from another clock on network drives
+                self._events.put((path, time.time()))
+        for path in self._snapshot.keys() - snapshot.keys():
+            self._forget(path)
+        self._snapshot = snapshot
+
+    def changed(self, path, when=None):
+        """Queues a changed file, called from the filesystem event thread."""
+        if is_supported(path):
+            self._events.put((path, when or time.time()))
+
+    def deleted(self, path):
+        """Queues a deleted file, called from the filesystem event thread."""
+        if is_supported(path):
+            # Its state is dropped by the main loop, which owns it, in order with the other changes
+            self._events.put((path, None))
+
+    def _forget(self, path):
+        """Drops the state of a deleted file."""
+        self._analyzers.pop(path, None)
+        self._hashes.pop(path, None)
+        self._pending.pop(path, None)
+        if self.aggregator is not None and self.aggregator.document(path) is not None:
+            self.aggregator.remove(path)
+            self.aggregator.save(self.aggregates)
+
+    def process_events(self, timeout):
+        """Moves queued changes to the pending files, waiting up to timeout seconds for the first one."""
+        try:
+            path, when = self._events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            if when is None:
+                self._forget(path)
+            else:
+                first, _ = self._pending.get(path, (when, when))
+                self._pending[path] = (min(first, when), time.time())
+            try:
+                path, when = self._events.get_nowait()
+            except queue.Empty:
+                return
+
+    def analyze_ready(self):
+        """Analyzes the pending files that have not changed for the debounce delay."""
+        now = time.time()
+        ready = [path for path, (_, last) in self._pending.items() if now - last >= self.debounce]
+        for path in ready:
+            first, _ = self._pending.pop(path)
+            if os.path.exists(path):
+                self.analyze(path, first)
+            else:
+                self._forget(path)
+
+    def prime(self):
+        """
+        Analyzes every file of the snapshot without saving a report, so that the first change of a
+        file already reuses its unchanged sections and a save that changed nothing is skipped.
+
+        Files that cannot be read or converted are left out, they are reported on their first change.
+        """
+        for path in self._snapshot:
+            if path in self._analyzers:
+                continue
+            try:
+                digest, markdown_input = self._read(path)
+            except (ValueError, OSError, UnicodeDecodeError):
+                continue
+            if markdown_input is None:
+                continue
+            analyzer = self._analyzers[path] = IncrementalAnalyzer(os.path.basename(path))
+            analyzer.analyze(markdown_input)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # A file changed since the snapshot keeps no hash, so the change is not taken for a no-op save
+            if (stat.st_mtime_ns, stat.st_size) == self._snapshot[path]:
+                self._hashes[path] = digest
+
+    def _read(self, path):
+        """Returns the content hash of a file and its Markdown lines, None if they did not change."""
+        with open(path, 'rb') as file:
+            digest = AnalysisCache.digest(file.read())
+        if self._hashes.get(path) == digest:
+            return digest, None # Saved without changes
+        return digest, read_markdown(path)
+
+    def analyze(self, path, changed_at):
+        """
+        Re-analyzes one file and saves its report.
+
+        Args:
+            path (str): The changed file.
+            changed_at (float): Time of the first change of the file, for the latency.
+        """
+        try:
+            digest, markdown_input = self._read(path)
+        except (ValueError, OSError, UnicodeDecodeError) as error:
+            print(f"Skipped {path}: {error}", file=sys.stderr)
+            return
+        if markdown_input is None:
+            return
+
+        analyzer = self._analyzers.get(path)
+        if analyzer is None: # A new file, or one that could not be read when the watcher started
+            analyzer = self._analyzers[path] = IncrementalAnalyzer(os.path.basename(path))
+        analysis = analyzer.analyze(markdown_input)
+        analysis.content_hash = digest
+        report = analysis.to_report()
+        self.repository.save(report.to_text(), analysis.file_name, path, digest, analysis.totals())
+        if self.aggregator is not None:
+            # Only this document's summary changes, its course and department are updated in place
+            self.aggregator.add(path, report)
+            self.aggregator.save(self.aggregates)
+        self._hashes[path] = digest
+
+        latency = time.time() - changed_at
+        self.latencies.append(latency)
+        print(f"{path}: {analyzer.recomputed} sections re-analyzed, {analyzer.reused} reused, "
+              f"report saved {latency * 1000:.0f} ms after the change")
+
+    def run(self, stop=None):
+        """
+        Watches until stop is set or the process is interrupted.
+
+        Args:
+            stop (threading.Event): Set it from another thread to stop watching.
+        """
+        stop = stop or threading.Event()
+        observer = None
+        if not self.polling:
+            observer = Observer()
+            observer.schedule(_EventHandler(self), self.directory, recursive=True)
+            observer.start()
+        try:
+            # Changes made while priming are queued by the observer or found by the next poll
+            self.prime()
+            while not stop.is_set():
+                if observer is None:
+                    self.poll()
+                # Wake up often enough to honour the debounce delay, but sleep while nothing is pending
+                self.process_events(min(self.debounce, self.interval) if self._pending or observer is None
+                                    else self.interval)
+                self.analyze_ready()
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+
+if Observer is not None:
+    class _EventHandler(FileSystemEventHandler):
+        """Forwards watchdog events of files to a CourseWatcher."""
+
+        def __init__(self, watcher):
+            super().__init__()
+            self.watcher = watcher
+
+        def on_created(self, event):
+            if not event.is_directory:
+                self.watcher.changed(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                self.watcher.changed(event.src_path)
+
+        def on_deleted(self, event):
+            if not event.is_directory:
+                self.watcher.deleted(event.src_path)
+
+        def on_moved(self, event):
+            # Editors often save by writing a temporary file and renaming it over the original,
+            # a file renamed within the course is forgotten under its old name
+            if not event.is_directory:
+                self.watcher.deleted(event.src_path)
+                self.watcher.changed(event.dest_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-analyze the files of a course directory whenever they change.")
+    parser.add_argument('directory', help="directory tree to watch")
+    parser.add_argument('--repository', default='./repository', help="directory the reports are written to")
+    parser.add_argument('--debounce', type=float, default=0.2, help="seconds a file must stay unchanged before it is analyzed")
+    parser.add_argument('--interval', type=float, default=0.5, help="seconds between two scans when polling")
+    parser.add_argument('--polling', action='store_true', help="poll even if filesystem events are available")
+    parser.add_argument('--aggregate', help="keep the per-course aggregates in this file up to date")
+    parser.add_argument('--corpus-root', help="directory holding the course directories, for --aggregate "
+                                              "(default: the parent of the watched directory)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    with ReportRepository(args.repository) as repository:
+        try:
+            watcher = CourseWatcher(args.directory, repository, args.debounce, args.interval, args.polling,
+                                    args.aggregate, args.corpus_root)
+        except ValueError as error:
+            parser.error(str(error))
+        if watcher.aggregator is not None and not watcher.aggregator.covers(args.directory):
+            parser.error(f"{args.directory} is not below the corpus root {watcher.aggregator.root}")
+        print(f"Watching {args.directory} ({'polling' if watcher.polling else 'filesystem events'}), press Ctrl+C to stop")
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+    if watcher.latencies:
+        print(f"{len(watcher.latencies)} reports, latency mean {sum(watcher.latencies) / len(watcher.latencies) * 1000:.0f} ms, "
+              f"max {max(watcher.latencies) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())